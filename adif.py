@@ -1,9 +1,29 @@
-import logging
+import array
+import asyncio
+import bisect
+import calendar
+import collections.abc
+import concurrent.futures
 import datetime
+import functools
+import hashlib
+import http.client
+import io
+import itertools
+import json
+import logging
+import mmap
+import operator
+import os
+import re
+import sqlite3
+import ssl
+import sys
+import threading
 import time
 import urllib.error
 import urllib.parse
-import urllib.request
+import zlib
 
 """
 adif.py -- read/write/fetch from LoTW  and adif files on disk.
@@ -23,6 +43,9 @@ BANDS = ['2190M', '630M', '560M', '160M',
 
 MODES = ['CW', 'DATA', 'IMAGE', 'PHONE']
 
+LOTW_REPORT_URL = 'https://lotw.arrl.org/lotwuser/lotwreport.adi'
+LOTW_QSL_CARDS_URL = 'https://lotw.arrl.org/lotwuser/logbook/qslcards.php'
+
 """
 dict of DXCC countries.
 key is DXCC number
@@ -470,236 +493,1412 @@ def get_adif_country_name(dxcc):
     return country_tuple[0]
 
 
+class HttpBodyReader(io.RawIOBase):
+    """
+    raw stream of an http response body, decompressed as it is read if the server sent it gzipped.
+    """
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+        if (response.getheader('Content-Encoding') or '').lower() == 'gzip':
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self.decompressor = None
+        self.pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while len(self.pending) == 0:
+            data = self.response.read(65536)
+            if not data and self.response.length:
+                # the connection closed before the whole body arrived.
+                raise http.client.IncompleteRead(b'', self.response.length)
+            if self.decompressor is None:
+                if not data:
+                    return 0
+                self.pending = data
+            elif data:
+                self.pending = self.decompressor.decompress(data)
+            else:
+                if not self.decompressor.eof:
+                    raise http.client.IncompleteRead(b'')
+                self.pending = self.decompressor.flush()
+                self.decompressor = None
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def close(self):
+        self.response.close()
+        super().close()
+
+
+class LotwClient:
+    """
+    http client for LoTW calls.
+    one keep-alive connection is kept open and reused for each call to the same server.
+    responses are requested gzipped and decompressed as they stream in.
+    failed connections and server errors are retried with exponential backoff.
+    plain http urls work too, for testing against a local server.
+    """
+    redirect_statuses = (301, 302, 303, 307, 308)
+    max_redirects = 5
+
+    def __init__(self, timeout=60, retries=3, backoff=1.0):
+        """
+        :param timeout: socket timeout in seconds.
+        :param retries: number of times a failed request is tried again.
+        :param backoff: seconds to wait before the first retry, doubled for each retry after that.
+        """
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.connection = None
+        self.connection_key = None
+        self.response = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        self.response = None
+
+    def connect(self, scheme, netloc):
+        """
+        :return: the open connection to netloc, a new one if there is none or the last response was not read to the end.
+        """
+        if self.connection is not None:
+            if self.connection_key != (scheme, netloc) or (self.response is not None and not self.response.isclosed()):
+                self.close()
+        if self.connection is None:
+            if scheme == 'https':
+                self.connection = http.client.HTTPSConnection(netloc, timeout=self.timeout)
+            elif scheme == 'http':
+                self.connection = http.client.HTTPConnection(netloc, timeout=self.timeout)
+            else:
+                raise ValueError(f'cannot fetch {scheme} urls')
+            self.connection_key = (scheme, netloc)
+        return self.connection
+
+    def get(self, url, params=None):
+        """
+        send a GET request.
+        :param url: the url
+        :param params: dict of query parameters, added to the url
+        :return: binary stream of the decompressed response body, read it to the end so the connection can be reused.
+        :raises urllib.error.HTTPError: when the server returns an error status.
+        """
+        if params:
+            url += ('&' if '?' in url else '?') + urllib.parse.urlencode(params)
+        redirects = 0
+        attempt = 0
+        while True:
+            parts = urllib.parse.urlsplit(url)
+            path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+            reused = False
+            try:
+                connection = self.connect(parts.scheme, parts.netloc)
+                reused = connection.sock is not None
+                connection.request('GET', path, headers={'Accept-Encoding': 'gzip'})
+                response = connection.getresponse()
+                self.response = response
+            except (OSError, http.client.HTTPException) as ex:
+                self.close()
+                if reused and isinstance(ex, (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)):
+                    continue  # the server closed the idle keep-alive connection, open a new one.
+                if attempt >= self.retries:
+                    raise
+                logging.warning(f'request to {parts.netloc} failed: {ex}, retrying')
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+                continue
+            if response.status in self.redirect_statuses and redirects < self.max_redirects:
+                response.read()
+                url = urllib.parse.urljoin(url, response.getheader('Location'))
+                redirects += 1
+                continue
+            if response.status >= 500 and attempt < self.retries:
+                response.read()
+                logging.warning(f'request to {parts.netloc} returned {response.status} {response.reason}, retrying')
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+                continue
+            body = io.BufferedReader(HttpBodyReader(response), 1048576)
+            if response.status >= 400:
+                raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, body)
+            return body
+
+
 def call_lotw(**params):
+    """
+    fetch adif data from LoTW.  the response is parsed as it streams in, in large chunks.
+    :param params: url, filename and client, and the LoTW query parameters.
+                   if filename is set, the raw response is saved to that file.
+                   client is the LotwClient to use.  if it is not set, a new one is made,
+                   and closed when the call is done.
+    :return: adif header as dict, list of QSOs in qso_key order
+    """
+    client = params.pop('client', None)
+    if client is None:
+        with LotwClient() as client:
+            return call_lotw(client=client, **params)
     logging.debug('Calling LoTW')
     qsos = []
-    qso = {}
     header = {}
-    first_line = True
     if params.get('url'):
         url = params.pop('url')
     else:
-        url = 'https://lotw.arrl.org/lotwuser/lotwreport.adi'
+        url = LOTW_REPORT_URL
 
     if params.get('filename'):
         adif_file_name = params.pop('filename')
-        adif_file = open(adif_file_name, 'w')
+        adif_file = open(adif_file_name, 'wb')
     else:
         adif_file = None
 
-    data = urllib.parse.urlencode(params)
-    req = urllib.request.Request(url + '?' + data)
-    logging.debug(f'calling "{url}?{data}"')
+    logging.debug(f'calling "{url}"')
     t0 = time.time()
     try:
-        response = urllib.request.urlopen(req)
+        response = client.get(url, params)
         t1 = time.time()
     except urllib.error.HTTPError as q:
         logging.error(f'problem with request {url}')
         logging.error(q.reason)
         for line in q:
             logging.error(line)
+        if adif_file is not None:
+            adif_file.close()
         return None, None
 
-    for line in response:
-        try:
-            line = line.decode('iso-8859-1')
-        except Exception as inst:
-            logging.error(f'problem decoding lotw payload: {line} : {inst}')
-
-        line = line.strip()
-        if first_line:
-            if 'ARRL Logbook of the World' not in line:
-                logging.error(f'Problem fetching data from LoTW: {response}')
-                raise Exception('ADIF download failed: ' + line)
-            first_line = False
-        if adif_file is not None:
-            adif_file.write(line + '\n')
-        if len(line) > 0 and line[0] == '<':
-            item_name, item_value = adif_field(line)
-            if item_value is None or len(item_value) == 0:  # header field.
-                if item_name is not None:
-                    if item_name == 'eor':
-                        qsos.append(qso)
-                        qso = {}
-                    if item_name == 'eoh':
-                        header = qso
-                        qsos = []
-                        qso = {}
+    try:
+        chunks = adif_stream_chunks(response, adif_file)
+        first_chunk = next(chunks, '')
+        first_line = first_chunk.split('\n', 1)[0].strip()
+        if 'ARRL Logbook of the World' not in first_line:
+            logging.error(f'Problem fetching data from LoTW: {response}')
+            raise Exception('ADIF download failed: ' + first_line)
+        for element_name, record in adif_records(itertools.chain((first_chunk,), chunks)):
+            if element_name == 'eoh':
+                header = record
+                qsos = []
             else:
-                qso[item_name] = item_value
-    if adif_file is not None:
-        adif_file.close()
+                qsos.append(record)
+    finally:
+        if adif_file is not None:
+            adif_file.close()
     t2 = time.time()
-    logging.info(f'Fetched {len(qsos)} records in {t1-t0:.3f} sec, parsing took {t2-t1:.3f} sec.')
-    return header, sorted(qsos, key=lambda qso: qso_key(qso))
-
-
-def get_lotw_adif(username, password, callsign, filename=None, qso_qsorxsince='1900-01-01'):
-    return call_lotw(login=username,
-                     password=password,
-                     filename=filename,
-                     qso_query='1',
-                     qso_qsl='no',
-                     qso_owncall=callsign,
-                     qso_qsldetail='yes',
-                     qso_qsorxsince=qso_qsorxsince,
-                     )
-
-
-def get_qsl_cards(username, password, filename=None):
-    qsl_cards_header, qsl_cards = call_lotw(url='https://lotw.arrl.org/lotwuser/logbook/qslcards.php',
-                                            filename=filename,
-                                            login=username,
-                                            password=password,
-                                            ac_acct='1')
+    logging.info(f'Fetched {len(qsos)} records in {t1-t0:.3f} sec, reading and parsing took {t2-t1:.3f} sec.')
+    return header, sort_qsos(qsos)
+
+
+LOTW_CHECKPOINT_SUFFIX = '.checkpoint'
+LOTW_PARTIAL_SUFFIX = '.partial'
+
+
+def read_lotw_checkpoint(adif_file_name, query):
+    """
+    read the checkpoint left by a failed download to adif_file_name.
+    :param query: the LoTW query parameters, without the password and the since parameter.
+    :return: tuple of (watermark, list of the QSOs received so far),
+             (None, []) if there is no checkpoint for this query.
+    """
+    try:
+        with open(adif_file_name + LOTW_CHECKPOINT_SUFFIX, 'r') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None, []
+    if checkpoint.get('query') != query:
+        logging.warning(f'ignoring checkpoint for {adif_file_name}, it is for a different query')
+        return None, []
+    _, qsos = read_adif_file(adif_file_name + LOTW_PARTIAL_SUFFIX)
+    return checkpoint.get('watermark'), qsos
+
+
+def write_lotw_checkpoint(adif_file_name, query, watermark, qsos):
+    """
+    save the watermark and the QSOs received so far, so a failed download can be resumed.
+    """
+    write_adif_file({}, qsos, adif_file_name + LOTW_PARTIAL_SUFFIX, abridge_results=False)
+    with open(adif_file_name + LOTW_CHECKPOINT_SUFFIX, 'w') as f:
+        json.dump({'query': query, 'watermark': watermark}, f)
+    logging.info(f'checkpoint for {adif_file_name}: {len(qsos)} QSOs received up to {watermark}')
+
+
+def lotw_checkpoint_query(params, since_param):
+    """
+    :return: the query a checkpoint is for, the params without the client, the password and since_param.
+    """
+    return {key: value for key, value in params.items() if key not in ('client', 'password', since_param)}
+
+
+def remove_lotw_checkpoint(adif_file_name):
+    for suffix in (LOTW_CHECKPOINT_SUFFIX, LOTW_PARTIAL_SUFFIX):
+        if os.path.exists(adif_file_name + suffix):
+            os.remove(adif_file_name + suffix)
+
+
+def call_lotw_resumable(since_param, watermark_field, **params):
+    """
+    call_lotw that picks up where a failed download to the same file left off.
+    when the download fails or is interrupted, the complete QSOs in the partly written file
+    are saved with the watermark_field value of the last of them.  the next call with the same
+    query sets since_param to that watermark, fetches only the rest, and merges the two.
+    this relies on LoTW sending QSOs in the order it received them, like the
+    app_lotw_lastqsorx and app_lotw_lastqsl update path does.  if the watermark_field
+    values go backwards, the checkpoint is discarded and the next call starts from since_param again.
+    :param since_param: the query parameter that takes the watermark, qso_qsorxsince or qso_qslsince.
+    :param watermark_field: the QSO field the watermark comes from, app_lotw_rxqso or app_lotw_rxqsl.
+    :param params: call_lotw parameters.  without a filename there is no checkpoint.
+    :return: adif header as dict, list of QSOs in qso_key order
+    """
+    adif_file_name = params.get('filename')
+    if adif_file_name is None:
+        return call_lotw(**params)
+    query = lotw_checkpoint_query(params, since_param)
+    watermark, received_qsos = read_lotw_checkpoint(adif_file_name, query)
+    if watermark is not None:
+        logging.info(f'resuming download to {adif_file_name} from {watermark}, '
+                     f'{len(received_qsos)} QSOs already received')
+        params[since_param] = watermark
+    try:
+        header, qsos = call_lotw(**params)
+    except BaseException:
+        new_qsos = []
+        if os.path.exists(adif_file_name):
+            new_qsos = list(itertools.islice(iter_adif(adif_file_name), 1, None))
+        watermarks = [qso.get(watermark_field) for qso in new_qsos if qso.get(watermark_field)]
+        if any(later < earlier for earlier, later in zip(watermarks, watermarks[1:])):
+            # QSOs after the last one received might have been sent already, the watermark would skip some.
+            logging.warning(f'{watermark_field} is out of order in {adif_file_name}, '
+                            f'discarding the checkpoint, the next download starts over')
+            remove_lotw_checkpoint(adif_file_name)
+            raise
+        if len(watermarks) > 0:
+            watermark = watermarks[-1]
+            # the QSO at the old watermark is sent again, merge drops the copy.
+            _, received_qsos = merge({}, sort_qsos(received_qsos), new_qsos)
+            write_lotw_checkpoint(adif_file_name, query, watermark, received_qsos)
+        raise
+    if header is None:
+        return header, qsos
+    if len(received_qsos) > 0:
+        header, qsos = merge(header, sort_qsos(received_qsos), qsos)
+        write_adif_file(header, qsos, adif_file_name, abridge_results=False)
+    remove_lotw_checkpoint(adif_file_name)
+    return header, qsos
+
+
+def call_lotw_concurrently(calls, workers=None, timeout=60, retries=3):
+    """
+    make several LoTW calls at the same time from a pool of threads, each call on its own connection.
+    :param calls: list of (function, kwargs) tuples.  each function, like call_lotw, takes a client keyword argument.
+    :param workers: the most calls to make at once, default is all of them.
+    :param timeout: socket timeout for each LotwClient
+    :param retries: number of retries for each LotwClient
+    :return: list of the results of the calls, in the order of calls.
+    """
+    def call(function, kwargs):
+        with LotwClient(timeout=timeout, retries=retries) as client:
+            return function(client=client, **kwargs)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers or max(len(calls), 1)) as executor:
+        futures = [executor.submit(call, function, kwargs) for function, kwargs in calls]
+        return [future.result() for future in futures]
+
+
+def call_lotw_retrying(client=None, function=call_lotw, **params):
+    """
+    call_lotw, trying the whole call again if the download fails part way through.
+    only network errors like a dropped connection or a truncated response are tried again.  an error status
+    is returned at once, LotwClient.get has already retried the ones that might go away.
+    the client's retries and backoff are used between tries.
+    :param client: the LotwClient to use.  if it is not set, a new one is made, and closed when the call is done.
+    :param function: the function to call, call_lotw or one that takes the same parameters.
+    :return: adif header as dict, list of QSOs in qso_key order, or None, None if LoTW returned an error.
+    :raises Exception: if the last try fails.
+    """
+    if client is None:
+        with LotwClient() as client:
+            return call_lotw_retrying(client=client, function=function, **params)
+    attempt = 0
+    while True:
+        try:
+            return function(client=client, **params)
+        except (OSError, http.client.HTTPException) as ex:
+            client.close()
+            error = ex
+        if attempt >= client.retries:
+            raise Exception(f'LoTW download failed: {error}')
+        logging.warning(f'LoTW download failed: {error}, trying again')
+        time.sleep(client.backoff * 2 ** attempt)
+        attempt += 1
+
+
+def call_lotw_window(client=None, **params):
+    """
+    download one of get_lotw_adif's date windows, trying again and resuming from its checkpoint
+    like call_lotw_retrying and call_lotw_resumable.  when the window is done, it is saved as a
+    checkpoint at its last app_lotw_rxqso, so that when another window fails, the next download
+    only asks this window for the QSOs received since then.
+    :param params: call_lotw parameters.  without a filename there is no checkpoint.
+    :return: adif header as dict, list of QSOs in qso_key order
+    """
+    header, qsos = call_lotw_retrying(client=client,
+                                      function=functools.partial(call_lotw_resumable,
+                                                                 'qso_qsorxsince',
+                                                                 'app_lotw_rxqso'),
+                                      **params)
+    if header is not None and params.get('filename') is not None:
+        watermarks = [qso['app_lotw_rxqso'] for qso in qsos if qso.get('app_lotw_rxqso')]
+        watermark = max(watermarks) if len(watermarks) > 0 else params.get('qso_qsorxsince')
+        write_lotw_checkpoint(params['filename'], lotw_checkpoint_query(params, 'qso_qsorxsince'), watermark, qsos)
+    return header, qsos
+
+
+def lotw_date_windows(count, first_date='2000-01-01', last_date=None):
+    """
+    split QSO dates into windows for get_lotw_adif.
+    the first window starts at 1900-01-01, so that it also holds any QSOs before first_date.
+    the last window ends at last_date, default today.
+    :param count: number of windows, fewer if there are not that many days.
+    :return: list of (start date, end date) tuples of 'YYYY-MM-DD' strings, the end dates are inclusive.
+    """
+    first = datetime.date.fromisoformat(first_date)
+    last = datetime.date.fromisoformat(last_date) if last_date is not None else datetime.date.today()
+    days = (last - first).days + 1
+    count = max(1, min(count, days))
+    windows = []
+    start = datetime.date(1900, 1, 1)
+    for i in range(1, count + 1):
+        end = last if i == count else first + datetime.timedelta(days=days * i // count - 1)
+        windows.append((start.isoformat(), end.isoformat()))
+        start = end + datetime.timedelta(days=1)
+    return windows
+
+
+def get_lotw_adif(username, password, callsign, filename=None, qso_qsorxsince='1900-01-01', client=None,
+                  date_windows=None, workers=4, url=LOTW_REPORT_URL):
+    """
+    download QSOs from LoTW.  a download to a file that fails can be resumed, see call_lotw_resumable().
+    :param url: the LoTW report url, can be changed to use a stand-in server.
+    :param date_windows: optional list of (start date, end date) tuples from lotw_date_windows().
+                         each window is a separate request, up to workers of them at a time, each
+                         retried on its own if it fails.  the results are merged in qso_key order.
+                         with a filename, each window has its own file and checkpoint, so the windows
+                         that finished are kept when another one fails, see call_lotw_window().
+    :return: adif header as dict, list of QSOs in qso_key order
+    """
+    if not date_windows:
+        return call_lotw_resumable('qso_qsorxsince',
+                                   'app_lotw_rxqso',
+                                   client=client,
+                                   url=url,
+                                   login=username,
+                                   password=password,
+                                   filename=filename,
+                                   qso_query='1',
+                                   qso_qsl='no',
+                                   qso_owncall=callsign,
+                                   qso_qsldetail='yes',
+                                   qso_qsorxsince=qso_qsorxsince,
+                                   )
+
+    window_file_names = [None if filename is None else f'{filename}.{start_date}.{end_date}'
+                         for start_date, end_date in date_windows]
+    calls = [(call_lotw_window, {'url': url,
+                                 'login': username,
+                                 'password': password,
+                                 'filename': window_file_name,
+                                 'qso_query': '1',
+                                 'qso_qsl': 'no',
+                                 'qso_owncall': callsign,
+                                 'qso_qsldetail': 'yes',
+                                 'qso_qsorxsince': qso_qsorxsince,
+                                 'qso_startdate': start_date,
+                                 'qso_enddate': end_date,
+                                 })
+             for (start_date, end_date), window_file_name in zip(date_windows, window_file_names)]
+    client_settings = {} if client is None else {'timeout': client.timeout, 'retries': client.retries}
+    results = call_lotw_concurrently(calls, workers=workers, **client_settings)
+    if any(window_header is None for window_header, _ in results):
+        return None, None
+
+    header = dict(results[0][0])
+    for watermark in ('app_lotw_lastqsorx', 'app_lotw_lastqsl'):
+        values = [window_header[watermark] for window_header, _ in results if window_header.get(watermark)]
+        if len(values) > 0:
+            header[watermark] = max(values)
+    # the windows are in date order, and so are the QSOs in each, so this is usually only a check.
+    qsos = sort_qsos(itertools.chain.from_iterable(window_qsos for _, window_qsos in results))
+    header['app_lotw_numrec'] = str(len(qsos))
+    logging.info(f'fetched {len(qsos)} QSOs in {len(date_windows)} date windows')
+    if filename is not None:
+        write_adif_file(header, qsos, filename, abridge_results=False)
+        for window_file_name in window_file_names:
+            remove_lotw_checkpoint(window_file_name)
+            if os.path.exists(window_file_name):
+                os.remove(window_file_name)
+    return header, qsos
+
+
+def get_qsl_cards(username, password, filename=None, client=None, url=LOTW_QSL_CARDS_URL):
+    """
+    download the DXCC QSL cards from LoTW, trying again if the download fails part way through.
+    :return: adif header as dict, list of QSL cards in qso_key order
+    """
+    qsl_cards_header, qsl_cards = call_lotw_retrying(client=client,
+                                                     url=url,
+                                                     filename=filename,
+                                                     login=username,
+                                                     password=password,
+                                                     ac_acct='1')
     # add 'qsl_rcvd'='y' to be consistent with LoTW.
-    for qsl_card in qsl_cards:
+    for qsl_card in qsl_cards or []:
         qsl_card['qsl_rcvd'] = 'y'
     return qsl_cards_header, qsl_cards
 
 
-def adif_field(s):
-    state = 0
-    element_name = ''
-    element_size = 0
-    element_type = ''
-    element_value = ''
-    bytes_to_copy = 0
-    try:
-        for c in s:
-            if state == 0:  # initial, look for <
-                if c == '<':
-                    element_name = ''
-                    state = 1
-            elif state == 1:  # copying name
-                if c == ':':  # end of name, start of size
-                    element_name = element_name.lower()
-                    element_size = ''
-                    state = 2
-                elif c == '>':  # end of name, no size, not data, must be header
-                    state = 0
-                else:  # keep copying the name.
-                    element_name += c
-            elif state == 2:  # copying size
-                if c == ':':  # end of size, start of type
-                    element_type = ''
-                    bytes_to_copy = int(element_size.strip())
-                    state = 3
-                elif c == '>':
-                    element_value = ''
-                    bytes_to_copy = int(element_size.strip())
-                    state = 4
-                elif c.isdigit():
-                    element_size += c
-                else:  # not : or > or a digit, must be something else.
-                    if c in 'NnSs':
-                        element_type += c
-                        state = 3
-                    pass
-            elif state == 3:  # copying type
-                if c == '>':
-                    element_value = ''
-                    state = 4
-                else:
-                    element_type += c
-            elif state == 4:  # copying value.
-                if bytes_to_copy > 0:
-                    element_value += c
-                    bytes_to_copy -= 1
-                if bytes_to_copy == 0:
-                    state = 0  # start new adif value.
-    except Exception as exc:
-        logging.error(f'problem parsing adif field: "{s}" : {exc}')
-    return element_name, element_value
+class AdifStreamParser:
+    """
+    push parser for adif text that arrives in pieces.  each feed() returns the records that
+    were completed by that text, and finish() returns the rest, so that all of them together
+    are the records adif_records makes from the whole text.
+    the text is cut just after the last <eor> or <eoh>, and the part before the cut is parsed
+    with adif_records.  the cut is only kept when adif_records ended a record there.  when it did
+    not, say the <eor> is part of a value, the text is kept and parsed again with the next text.
+    """
+    def __init__(self):
+        self.buffer = ''
+        self.interned_values = {name: {} for name in adif_interned_fields}
+
+    def feed(self, text):
+        """
+        :param text: adif text, decoded as iso-8859-1 so that one char is one byte.
+        :return: list of (name, fields) tuples, as adif_records makes.
+        """
+        search_start = max(len(self.buffer) - 4, 0)  # a tag can straddle the old and new text.
+        self.buffer += text
+        lowered = self.buffer[search_start:].lower()
+        end = max(lowered.rfind('<eor>'), lowered.rfind('<eoh>'))
+        if end < 0:
+            return []
+        end += search_start + 5
+        records = []
+        parser = adif_records((self.buffer[:end],), self.interned_values)
+        while True:
+            try:
+                records.append(next(parser))
+            except StopIteration as stop:
+                if stop.value != {}:
+                    return []  # the text after the cut belongs to an unfinished record.
+                break
+        self.buffer = self.buffer[end:]
+        return records
+
+    def finish(self):
+        """
+        :return: list of (name, fields) tuples of the text that was not parsed yet.
+        """
+        records = list(adif_records((self.buffer,), self.interned_values))
+        self.buffer = ''
+        return records
+
+
+async def async_http_get(url, params=None, timeout=60, max_redirects=5):
+    """
+    minimal asyncio http/1.1 GET, enough for LoTW.  the response is requested gzipped.
+    :param url: the url
+    :param params: dict of query parameters, added to the url
+    :param timeout: seconds to wait for the connection and for each read.
+    :return: async generator of the decompressed response body in chunks, as they arrive.
+    :raises urllib.error.HTTPError: when the server returns an error status.
+    """
+    if params:
+        url += ('&' if '?' in url else '?') + urllib.parse.urlencode(params)
+    for _ in range(max_redirects + 1):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f'cannot fetch {parts.scheme} urls')
+        ssl_context = ssl.create_default_context() if parts.scheme == 'https' else None
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(parts.hostname, port, ssl=ssl_context),
+                                                timeout)
+        try:
+            path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nAccept-Encoding: gzip\r\n'
+                         f'Connection: close\r\n\r\n'.encode('iso-8859-1'))
+            status_line = (await asyncio.wait_for(reader.readline(), timeout)).decode('iso-8859-1').split(None, 2)
+            if len(status_line) < 2:
+                raise http.client.BadStatusLine(' '.join(status_line))
+            status = int(status_line[1])
+            reason = status_line[2].strip() if len(status_line) > 2 else ''
+            headers = {}
+            while True:
+                line = (await asyncio.wait_for(reader.readline(), timeout)).decode('iso-8859-1')
+                if line in ('\r\n', '\n', ''):
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            if status in LotwClient.redirect_statuses and 'location' in headers:
+                url = urllib.parse.urljoin(url, headers['location'])
+                continue
+
+            if headers.get('content-encoding', '').lower() == 'gzip':
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            else:
+                decompressor = None
+            body = async_http_body(reader, headers, timeout)
+            if status >= 400:
+                data = b''.join([chunk async for chunk in body])
+                if decompressor is not None:
+                    data = decompressor.decompress(data)
+                raise urllib.error.HTTPError(url, status, reason, headers, io.BytesIO(data))
+            async for chunk in body:
+                if decompressor is not None:
+                    chunk = decompressor.decompress(chunk)
+                if chunk:
+                    yield chunk
+            if decompressor is not None:
+                if not decompressor.eof:
+                    raise http.client.IncompleteRead(b'')
+                chunk = decompressor.flush()
+                if chunk:
+                    yield chunk
+            return
+        finally:
+            writer.close()
+    raise urllib.error.HTTPError(url, status, 'too many redirects', headers, io.BytesIO(b''))
 
 
-def chars_from_file(filename, chunksize=8192):
-    with open(filename, 'rb') as f:
+async def async_http_body(reader, headers, timeout):
+    """
+    :return: async generator of the raw body of an http response, handling chunked transfer encoding.
+    """
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
         while True:
-            chunk = f.read(chunksize)
-            if chunk:
-                for b in chunk:
-                    yield chr(b)
+            size_line = await asyncio.wait_for(reader.readline(), timeout)
+            if not size_line:
+                raise http.client.IncompleteRead(b'')
+            size = int(size_line.split(b';')[0], 16)
+            if size == 0:
+                while (await asyncio.wait_for(reader.readline(), timeout)) not in (b'\r\n', b'\n', b''):
+                    pass  # skip the trailer
+                return
+            try:
+                yield await asyncio.wait_for(reader.readexactly(size), timeout)
+                await asyncio.wait_for(reader.readexactly(2), timeout)
+            except asyncio.IncompleteReadError as ire:
+                raise http.client.IncompleteRead(ire.partial)
+    elif 'content-length' in headers:
+        remaining = int(headers['content-length'])
+        while remaining > 0:
+            data = await asyncio.wait_for(reader.read(min(remaining, 1048576)), timeout)
+            if not data:
+                raise http.client.IncompleteRead(b'', remaining)
+            remaining -= len(data)
+            yield data
+    else:
+        while True:
+            data = await asyncio.wait_for(reader.read(1048576), timeout)
+            if not data:
+                return
+            yield data
+
+
+async def call_lotw_async(consumer=None, timeout=60, **params):
+    """
+    asyncio version of call_lotw.  the response is parsed while it streams in, and each batch of
+    QSOs is passed to the consumer coroutine before the download has finished.
+    :param consumer: optional coroutine function, awaited with each list of new QSOs, like QsoMerger.
+    :param timeout: seconds to wait for the connection and for each read.
+    :param params: url and filename, and the LoTW query parameters, as for call_lotw.
+    :return: adif header as dict, list of QSOs in qso_key order
+    """
+    logging.debug('Calling LoTW')
+    url = params.pop('url', None) or LOTW_REPORT_URL
+    adif_file_name = params.pop('filename', None)
+    adif_file = open(adif_file_name, 'wb') if adif_file_name else None
+    header = {}
+    qsos = []
+    first_text = ''
+    parser = AdifStreamParser()
+
+    async def take(records):
+        nonlocal header, qsos
+        new_qsos = []
+        for element_name, record in records:
+            if element_name == 'eoh':
+                header = record
+                qsos = []
             else:
-                break
+                new_qsos.append(record)
+        if len(new_qsos) > 0:
+            qsos.extend(new_qsos)
+            if consumer is not None:
+                await consumer(new_qsos)
+
+    t0 = time.time()
+    try:
+        async for chunk in async_http_get(url, params, timeout):
+            if adif_file is not None:
+                adif_file.write(chunk)
+            text = chunk.decode('iso-8859-1')
+            if first_text is not None:
+                first_text += text
+                if '\n' not in first_text:
+                    continue
+                text = first_text
+                first_line = first_text.split('\n', 1)[0].strip()
+                if 'ARRL Logbook of the World' not in first_line:
+                    logging.error(f'Problem fetching data from LoTW: {url}')
+                    raise Exception('ADIF download failed: ' + first_line)
+                first_text = None
+            await take(parser.feed(text))
+        if first_text is not None:
+            raise Exception('ADIF download failed: ' + first_text.strip())
+        await take(parser.finish())
+    except urllib.error.HTTPError as q:
+        logging.error(f'problem with request {url}')
+        logging.error(q.reason)
+        for line in q:
+            logging.error(line)
+        return None, None
+    finally:
+        if adif_file is not None:
+            adif_file.close()
+    logging.info(f'Fetched {len(qsos)} records in {time.time() - t0:.3f} sec.')
+    return header, sort_qsos(qsos)
+
+
+class QsoMerger:
+    """
+    consumer for call_lotw_async that merges each batch of new QSOs into a log as it arrives.
+    QSOs already in the log are updated right away, the added QSOs are kept until finish()
+    splices them into the log, so the log is copied once and not once per batch.
+    """
+    def __init__(self, header, qsos):
+        self.header = header
+        self.qsos = qsos
+        self.qso_dict = qso_index(qsos)
+        self.added_qsos = []
+
+    async def __call__(self, new_qsos):
+        _, added_qsos = merge({}, [], new_qsos, self.qso_dict)
+        self.added_qsos.extend(added_qsos)
+
+    def finish(self):
+        """
+        splice the added QSOs into the log.
+        :return: header, the merged list of QSOs in qso_key order
+        """
+        if len(self.added_qsos) > 0:
+            self.qsos = insert_qsos(self.qsos, sort_qsos(self.added_qsos))
+            self.added_qsos = []
+        self.header['app_lotw_numrec'] = str(len(self.qsos))
+        return self.header, self.qsos
+
+
+def run_lotw_syncs(syncs, concurrency=4, timeout=60):
+    """
+    run several LoTW downloads, for different accounts or callsigns, under one asyncio event loop.
+    :param syncs: list of dicts of call_lotw_async parameters, including any consumer.
+    :param concurrency: the most downloads to run at the same time.
+    :param timeout: seconds to wait for each connection and read.
+    :return: list of (header, qsos) tuples, in the order of syncs.
+    """
+    async def run_all():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(params):
+            async with semaphore:
+                return await call_lotw_async(timeout=timeout, **params)
+
+        return await asyncio.gather(*(run(dict(params)) for params in syncs))
+
+    return asyncio.run(run_all())
+
+
+"""
+fields that only take a few distinct values.  while parsing a log, the parser keeps one copy of
+each value of these fields, so a large log holds references to a few hundred strings instead of
+a new string in every QSO, and comparing two of them is usually an identity check.
+"""
+adif_interned_fields = frozenset(['app_lotw_mode',
+                                  'app_lotw_modegroup',
+                                  'app_lotw_owncall',
+                                  'band',
+                                  'country',
+                                  'cqz',
+                                  'dxcc',
+                                  'ituz',
+                                  'lotw_qsl_rcvd',
+                                  'lotw_qsl_sent',
+                                  'mode',
+                                  'my_country',
+                                  'my_dxcc',
+                                  'prop_mode',
+                                  'qsl_rcvd',
+                                  'qsl_sent',
+                                  'sat_name',
+                                  'state',
+                                  'station_callsign',
+                                  'submode',
+                                  ])
+
+
+def parse_adif_tag(tag):
+    """
+    parse the text between < and > of an adif tag.
+    the name is interned, so every QSO shares the same key strings.
+    :return: tuple of lower case name and length, length is None for tags like <eoh> and <eor>.
+    """
+    parts = tag.split(':', 2)
+    if len(parts) == 1:
+        return sys.intern(tag.lower()), None
+    return sys.intern(parts[0].lower()), int(parts[1].strip())
+
+
+def adif_stream_chunks(stream, tee_file=None, chunk_size=1048576):
+    """
+    read a binary stream in large chunks, decoded as iso-8859-1 so that one char is one byte.
+    :param stream: binary file or http response
+    :param tee_file: if not None, binary file that each raw chunk is also written to.
+    """
+    # read1 returns what has arrived rather than waiting for a full chunk, so when a
+    # download fails part way, every byte received has already been passed on.
+    read = getattr(stream, 'read1', stream.read)
+    while True:
+        chunk = read(chunk_size)
+        if not chunk:
+            break
+        if tee_file is not None:
+            tee_file.write(chunk)
+        yield chunk.decode('iso-8859-1')
+
+
+def adif_file_chunks(adif_file_name, chunk_size=1048576):
+    """
+    read a file in large chunks, decoded as iso-8859-1 so that one char is one byte.
+    """
+    with open(adif_file_name, 'rb') as f:
+        yield from adif_stream_chunks(f, chunk_size=chunk_size)
+
+
+def adif_pieces(chunks):
+    """
+    split a stream of adif text chunks on '<'.  a piece that straddles chunks is glued back together.
+    :return: generator of lists of pieces, one list per chunk.
+    """
+    piece = None
+    for chunk in chunks:
+        pieces = chunk.split('<')
+        if piece is not None:
+            pieces[0] = piece + pieces[0]
+        piece = pieces.pop()
+        yield pieces
+    if piece is not None:
+        yield [piece]
+
+
+def adif_records(chunks, interned_values=None):
+    """
+    bulk adif parser.  the text is split on '<', each piece is then a tag
+    followed by the value and any junk before the next tag.  the values are sliced
+    using the declared length; pieces are only glued back together in the rare case
+    that a tag or value contains a '<'.
+    values of the fields in adif_interned_fields are shared between records.
+    :param chunks: iterable of adif text chunks, decoded as iso-8859-1 so that one char is one byte.
+    :param interned_values: dict of field name to a dict of each value seen to its shared copy,
+                            to share values across calls.  by default they are shared within this parse only.
+    :return: generator of (name, fields) tuples, one for each <eoh> or <eor>.  the generator's return value
+             is the record after the last <eor>, or None if the text ends inside a tag or a value.
+    """
+    tags = {}  # cache of parsed tags, there are not many distinct ones.
+    if interned_values is None:
+        interned_values = {name: {} for name in adif_interned_fields}
+    record = {}
+    pieces = itertools.chain.from_iterable(adif_pieces(chunks))
+    next(pieces, None)  # anything before the first tag is not adif data.
+    for piece in pieces:
+        tag, sep, rest = piece.partition('>')
+        while not sep:  # tag contains a '<'
+            next_piece = next(pieces, None)
+            if next_piece is None:
+                if piece.count(':') > 1:  # unterminated tag, but size is complete and must be valid.
+                    parse_adif_tag(piece)
+                return None
+            piece += '<' + next_piece
+            tag, sep, rest = piece.partition('>')
+        parsed = tags.get(tag)
+        if parsed is None:
+            parsed = tags[tag] = parse_adif_tag(tag)
+        element_name, element_size = parsed
+        if element_size is None:
+            if element_name == 'eoh' or element_name == 'eor':
+                yield element_name, record
+                record = {}
+        elif element_size > 0:
+            while element_size > len(rest):  # value contains a '<'
+                next_piece = next(pieces, None)
+                if next_piece is None:
+                    return None
+                rest += '<' + next_piece
+            value = rest[:element_size]
+            values = interned_values.get(element_name)
+            if values is not None:
+                value = values.setdefault(value, value)
+            record[element_name] = value
+        elif element_size == 0:
+            # the character following an empty value is always consumed.
+            # when that is the '<' of the next tag, that tag is skipped.
+            if not rest and next(pieces, None) is None:
+                return None
+            record[element_name] = ''
+        else:  # negative size, nothing after this can be parsed.
+            return None
+    return record
+
+
+def adif_header_and_qsos(records, adif_file_name):
+    """
+    turn the (name, fields) tuples from adif_records into the header followed by the QSOs.
+    a later <eoh> replaces the header, as it always has, so the header already yielded
+    is changed in place, and is only final when all the QSOs have been read.
+    """
+    header = None
+    for element_name, record in records:
+        if element_name == 'eoh':
+            if header is None:
+                header = record
+                yield header
+            else:
+                logging.debug(f'replacing the header of {adif_file_name} with a later one')
+                header.clear()
+                header.update(record)
+        else:
+            if header is None:
+                header = {}
+                yield header
+            yield record
+    if header is None:
+        yield {}
+
+
+def iter_adif(adif_file_name):
+    """
+    streaming adif file reader.
+    the file is read in chunks, so only one QSO is held in memory at a time.
+    :param adif_file_name:  the name of the file to read.
+    :return: generator that yields the adif header as dict, then each QSO as dict, in file order.
+    """
+    return adif_header_and_qsos(adif_records(adif_file_chunks(adif_file_name)), adif_file_name)
+
+
+def adif_file_ranges(adif_file_name, count):
+    """
+    split an adif file into up to count byte ranges of about the same size.
+    every range but the last ends just after an <eor>, so each can be parsed on its own.
+    :return: list of (start, end) tuples
+    """
+    with open(adif_file_name, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        if file_size == 0:
+            return [(0, 0)]
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as file_map:
+            boundaries = [0]
+            for i in range(1, count):
+                match = MappedAdifFile.eor_pattern.search(file_map, max(file_size * i // count, boundaries[-1]))
+                if match is None:
+                    break
+                boundaries.append(match.end())
+    boundaries.append(file_size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+
+"""
+files smaller than this are parsed in one process, starting the workers would take longer than the parse.
+"""
+ADIF_PARALLEL_MIN_SIZE = 4 * 1048576
+
+
+def read_adif_range(adif_file_name, start, end, compact=False):
+    """
+    parse one byte range of an adif file.  this runs in the worker processes.
+    :param compact: send the records back as one flat list of values, with the field names kept
+                    once for each layout, to be made into CompactQso by adif_range_records().
+                    dicts are sent as they are, unpickling them is the cheapest way to build them.
+    :return: list of (name, fields) tuples from adif_records, or when compact, tuple of
+             (list of (name, field names) layouts, array of the layout number of each record, list of values)
+    """
+    with open(adif_file_name, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('iso-8859-1')
+    if not compact:
+        return list(adif_records((text,)))
+    layouts = {}
+    numbers = array.array('l')
+    values = []
+    for element_name, fields in adif_records((text,)):
+        layout = (element_name, tuple(fields))
+        number = layouts.get(layout)
+        if number is None:
+            number = layouts[layout] = len(layouts)
+        numbers.append(number)
+        values.extend(fields.values())
+    return list(layouts), numbers, values
+
+
+def adif_range_records(range_data, compact=False):
+    """
+    turn what read_adif_range() sent back into (name, fields) tuples, like adif_records makes.
+    the QSOs are CompactQso when compact, the header is always a dict.
+    """
+    if not compact:
+        yield from range_data
+        return
+    layouts, numbers, values = range_data
+    layouts = [(name, CompactQso.get_layout(names) if name == 'eor' else names, len(names))
+               for name, names in layouts]
+    from_layout = CompactQso.from_layout
+    start = 0
+    for number in numbers:
+        name, layout, size = layouts[number]
+        end = start + size
+        if name == 'eor':
+            yield name, from_layout(layout, values[start:end])
+        else:
+            yield name, dict(zip(layout, values[start:end]))
+        start = end
 
 
-def read_adif_file(adif_file_name):
+def iter_adif_parallel(adif_file_name, workers, compact=False):
+    """
+    parse an adif file with a pool of worker processes, each parsing a range of records.
+    the file is split into more ranges than there are workers, so that the parent turns the first
+    ranges into QSOs while the workers are still parsing the rest.
+    a small file, or a computer with one cpu, is parsed in this process instead.
+    note that a value containing the text <eor> would confuse the split.
+    :param adif_file_name:  the name of the file to read.
+    :param workers: number of worker processes.
+    :param compact: yield the QSOs as CompactQso instead of dict.
+    :return: generator that yields the adif header as dict, then each QSO, in file order.
+    """
+    workers = min(workers, os.cpu_count() or 1)
+    if workers <= 1 or os.path.getsize(adif_file_name) < ADIF_PARALLEL_MIN_SIZE:
+        qsos = iter_adif(adif_file_name)
+        yield next(qsos)
+        yield from (map(CompactQso, qsos) if compact else qsos)
+        return
+    ranges = adif_file_ranges(adif_file_name, workers * 4)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+        futures = [executor.submit(read_adif_range, adif_file_name, start, end, compact) for start, end in ranges]
+        records = itertools.chain.from_iterable(adif_range_records(future.result(), compact) for future in futures)
+        yield from adif_header_and_qsos(records, adif_file_name)
+
+
+ADIF_CACHE_VERSION = 2
+ADIF_CACHE_SUFFIX = '.cache'
+
+
+def adif_file_identity(adif_file_name):
+    """
+    get the size and modification time of a file, the cheap check that its cache is current.
+    """
+    stat = os.stat(adif_file_name)
+    return ADIF_CACHE_VERSION, stat.st_size, stat.st_mtime_ns
+
+
+def adif_file_digest(adif_file_name):
+    """
+    get the content hash of a file, the check that its cache is current when the size and time match.
+    """
+    digest = hashlib.sha256()
+    with open(adif_file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(1048576), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_adif_cache(adif_file_name, identity):
+    """
+    read the parsed header and QSOs from the cache file next to an adif file.
+    the file is only hashed when the size and modification time in identity match the cache.
+    the cache is json, so a planted cache file can at worst give wrong QSOs, it can not run code.
+    :param identity: from adif_file_identity()
+    :return: (header, qsos) or None if there is no cache or it is not current.
+    """
+    cache_file_name = adif_file_name + ADIF_CACHE_SUFFIX
+    try:
+        with open(cache_file_name, 'r', encoding='utf-8') as f:
+            cached_identity = json.loads(f.readline())
+            if cached_identity[:-1] != list(identity) or cached_identity[-1] != adif_file_digest(adif_file_name):
+                logging.info(f'cache {cache_file_name} is stale')
+                return None
+            header, qsos = json.loads(f.read())
+        if not isinstance(header, dict) or not isinstance(qsos, list) or \
+                not all(isinstance(qso, dict) for qso in qsos):
+            raise ValueError('not a header and a list of QSOs')
+        return header, qsos
+    except FileNotFoundError:
+        return None
+    except Exception as exc:
+        logging.warning(f'could not read cache {cache_file_name}: {exc}')
+        return None
+
+
+def write_adif_cache(adif_file_name, identity, header, qsos):
+    """
+    write the parsed header and QSOs to a cache file next to the adif file.
+    the identity is written on the first line so it can be checked without loading the QSOs.
+    a cache that can not be written is only logged, it is not needed to go on.
+    :param identity: from adif_file_identity(), with the adif_file_digest() of the file added.
+    """
+    cache_file_name = adif_file_name + ADIF_CACHE_SUFFIX
+    temp_file_name = cache_file_name + '.tmp'
+    try:
+        with open(temp_file_name, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(identity) + '\n')
+            # CompactQso is cached as a plain dict.
+            f.write(json.dumps([header, qsos], separators=(',', ':'), default=dict))
+        os.replace(temp_file_name, cache_file_name)
+        logging.info(f'wrote cache {cache_file_name}')
+    except Exception as exc:  # OSError, or a QSO value that json can not write.
+        logging.warning(f'could not write cache {cache_file_name}: {exc}')
+        if os.path.exists(temp_file_name):
+            os.remove(temp_file_name)
+
+
+def read_adif_file(adif_file_name, workers=1, compact=False, cache=False):
     """
     adif file reader/parser.
     :param adif_file_name:  the name of the file to read.
+    :param workers: number of processes to parse with, large files parse faster on more cores.
+    :param compact: return QSOs as CompactQso instead of dict, to save memory.
+    :param cache: keep the parsed data in a cache file next to the adif file, and use it when it is current.
     :return: adif header as dict, array of QSO data as list of dicts
     """
     logging.info(f'reading adif file {adif_file_name}')
-    qsos = []
-    header = {}
-    qso = {}
-    # parse adif, bytewise.  state machine:
-    # 0 / clear  not copying
-    # 1 / name
-    # 2 / size
-    # 3 / type
-    # 4 / value
-    element_name = ''
-    element_size = ''
-    element_value = ''
-    element_type = ''
-    state = 0
-    bytes_to_copy = 0
+    identity = None
+    if cache and os.path.exists(adif_file_name):
+        identity = adif_file_identity(adif_file_name)
+        cached = read_adif_cache(adif_file_name, identity)
+        if cached is not None:
+            header, qsos = cached
+            if compact:
+                qsos = list(map(CompactQso, qsos))
+            logging.info(f'read {len(qsos)} QSOs from cache for {adif_file_name}')
+            return header, qsos
+        identity += (adif_file_digest(adif_file_name),)
 
+    if workers > 1:
+        qsos = iter_adif_parallel(adif_file_name, workers, compact)
+    else:
+        qsos = iter_adif(adif_file_name)
     try:
-        for c in chars_from_file(adif_file_name):
-            if state == 0:  # not parsing adif data from file.
-                if c == '<':
-                    element_name = ''
-                    state = 1
-            elif state == 1:  # copying name
-                if c == ':':  # end of name, start of size
-                    element_name = element_name.lower()
-                    element_size = ''
-                    state = 2
-                elif c == '>':  # end of name, no size, not data, must be header
-                    element_name = element_name.lower()
-                    if element_name == 'eoh':
-                        header = qso
-                        qso = {}
-                    elif element_name == 'eor':
-                        qsos.append(qso)
-                        qso = {}
-                    state = 0
-                else:  # keep copying the name.
-                    element_name += c
-            elif state == 2:  # copying size
-                if c == ':':  # end of size, start of type
-                    element_type = ''
-                    bytes_to_copy = int(element_size.strip())
-                    state = 3
-                elif c == '>':
-                    element_value = ''
-                    bytes_to_copy = int(element_size.strip())
-                    state = 4
-                else:
-                    element_size += c
-            elif state == 3:  # copying type
-                if c == '>':
-                    element_value = ''
-                    state = 4
-                else:
-                    element_type += c
-            elif state == 4:  # copying value.
-                if bytes_to_copy > 0:
-                    element_value += c
-                    bytes_to_copy -= 1
-                if bytes_to_copy == 0:
-                    qso[element_name.lower()] = element_value
-                    state = 0  # start new adif value.
+        header = next(qsos)
     except FileNotFoundError as fnfe:
         logging.warning(f'could not read file {adif_file_name}')
         logging.warning(fnfe)
         return None, []
+    if compact and workers <= 1:
+        qsos = map(CompactQso, qsos)
+    qsos = sort_qsos(qsos)
     logging.info(f'read {len(qsos)} QSOs from {adif_file_name}')
-    return header, sorted(qsos, key=lambda sort_qso: qso_key(sort_qso))
+    if identity is not None:
+        write_adif_cache(adif_file_name, identity, header, qsos)
+    return header, qsos
+
+
+class MappedAdifFile:
+    """
+    read-only memory-mapped adif file.
+    the file is scanned once for the <eoh> and <eor> tags to build a compact index
+    of where each record ends, a QSO is only parsed when it is accessed.
+    QSOs are in file order, not sorted.
+    note that a value containing the text <eor> would confuse the index.
+    """
+    eoh_pattern = re.compile(rb'<eoh>', re.IGNORECASE)
+    eor_pattern = re.compile(rb'<eor>', re.IGNORECASE)
+
+    def __init__(self, adif_file_name):
+        self.adif_file_name = adif_file_name
+        self.header_end = 0
+        self._header = None
+        with open(adif_file_name, 'rb') as f:
+            if os.fstat(f.fileno()).st_size > 0:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.map = b''  # empty files cannot be mapped.
+        first_eor = self.eor_pattern.search(self.map)
+        first_eor_start = first_eor.start() if first_eor is not None else len(self.map)
+        eoh = self.eoh_pattern.search(self.map, 0, first_eor_start)
+        if eoh is not None:
+            self.header_end = eoh.end()
+        # record_ends[i] is the offset just after the <eor> of QSO i, QSO i starts at record_ends[i-1].
+        self.record_ends = array.array('q', [match.end() for match in self.eor_pattern.finditer(self.map,
+                                                                                                 self.header_end)])
+        logging.info(f'mapped {len(self.record_ends)} QSOs in {adif_file_name}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self.record_ends)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self.record_ends)
+        if index < 0 or index >= len(self.record_ends):
+            raise IndexError('QSO index out of range')
+        start = self.record_ends[index - 1] if index > 0 else self.header_end
+        return self._parse(start, self.record_ends[index])
+
+    def __iter__(self):
+        start = self.header_end
+        for end in self.record_ends:
+            yield self._parse(start, end)
+            start = end
+
+    @property
+    def header(self):
+        if self._header is None:
+            self._header = self._parse(0, self.header_end) if self.header_end > 0 else {}
+        return self._header
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+
+    def _parse(self, start, end):
+        for element_name, record in adif_records((self.map[start:end].decode('iso-8859-1'),)):
+            return record
+        logging.warning(f'could not parse record at offset {start} in {self.adif_file_name}')
+        return {}
+
+
+def read_adif_tail(adif_file_name, offset, check_bytes, have_header):
+    """
+    read the complete records added to an adif file since offset, for AdifTail.
+    this only uses its arguments, so it can run in a worker process.
+    :param adif_file_name:  the name of the file to read.
+    :param offset: offset just after the last complete record already read, 0 to read from the start.
+    :param check_bytes: the bytes just before offset, if they changed the file was rewritten.
+    :param have_header: True if the header has already been read.
+    :return: tuple of (rewritten, header, new QSOs, new offset, new check bytes).
+             rewritten is True when the file was read again from the start.
+             header is None unless the header was read by this call.
+    """
+    rewritten = False
+    with open(adif_file_name, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        if offset > 0:
+            f.seek(offset - len(check_bytes))
+            if file_size < offset or f.read(len(check_bytes)) != check_bytes:
+                logging.warning(f'{adif_file_name} was rewritten, reading it again')
+                rewritten = True
+                offset = 0
+                check_bytes = b''
+                have_header = False
+                f.seek(0)
+        data = f.read()
+
+    # only parse up to the last complete record, the rest may still be being written.
+    lowered = data.lower()
+    end = lowered.rfind(b'<eor>')
+    if end < 0 and not have_header:
+        end = lowered.find(b'<eoh>')
+    if end < 0:
+        return rewritten, None, [], offset, check_bytes
+    end += 5
+    header = None
+    new_qsos = []
+    for element_name, record in adif_records((data[:end].decode('iso-8859-1'),)):
+        if element_name == 'eoh':
+            if not have_header:
+                header = record
+                have_header = True
+            else:
+                logging.warning(f'ignoring extra header in {adif_file_name}')
+        else:
+            if not have_header:
+                header = {}
+                have_header = True
+            new_qsos.append(record)
+    check_bytes = (check_bytes + data[:end])[-AdifTail.check_size:]
+    return rewritten, header, new_qsos, offset + end, check_bytes
+
+
+class AdifTail:
+    """
+    incremental reader for an adif file that is being appended to, like a contest log.
+    the offset just after the last complete <eor> is remembered, and each refresh()
+    only reads and parses the bytes added since then.  if the file shrinks or the
+    bytes before that offset change, the file was rewritten and it is read again.
+    QSOs are in file order, not sorted.
+    """
+    check_size = 256  # number of bytes before the offset that must not change.
+
+    def __init__(self, adif_file_name):
+        self.adif_file_name = adif_file_name
+        self.reset()
+
+    def reset(self):
+        """
+        forget everything read from the file, so the next refresh reads it from the start.
+        """
+        self.header = None
+        self.qsos = []
+        self.offset = 0
+        self.check_bytes = b''
+
+    def refresh(self):
+        """
+        read any complete QSOs appended to the file since the last refresh.
+        :return: list of the new QSOs, they are also added to self.qsos
+        """
+        return self.update(read_adif_tail(self.adif_file_name, self.offset, self.check_bytes, self.header is not None))
+
+    def update(self, tail_data):
+        """
+        apply what read_adif_tail() read from this file.
+        :return: list of the new QSOs, they are also added to self.qsos
+        """
+        rewritten, header, new_qsos, offset, check_bytes = tail_data
+        if rewritten:
+            self.reset()
+        if header is not None:
+            self.header = header
+        self.offset = offset
+        self.check_bytes = check_bytes
+        self.qsos.extend(new_qsos)
+        logging.debug(f'read {len(new_qsos)} new QSOs from {self.adif_file_name}, offset now {self.offset}')
+        return new_qsos
+
+
+def refresh_adif_tails(tails, workers=1):
+    """
+    refresh several AdifTails, reading the files in parallel worker processes when workers > 1.
+    :return: list of the lists of new QSOs, one for each tail.
+    """
+    if workers <= 1 or len(tails) <= 1:
+        return [tail.refresh() for tail in tails]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(tails))) as executor:
+        futures = [executor.submit(read_adif_tail, tail.adif_file_name, tail.offset, tail.check_bytes,
+                                   tail.header is not None) for tail in tails]
+        return [tail.update(future.result()) for tail, future in zip(tails, futures)]
+
+
+def qso_presence(qso_lists, key):
+    """
+    build an N-way presence map of QSOs in one pass over the lists.
+    :param qso_lists: list of N lists of QSOs
+    :param key: function that makes the key QSOs are matched on
+    :return: dict of key to [bitmap, QSO], bit i of bitmap is set when list i has a QSO with that key,
+             QSO is the first QSO seen with that key.
+    """
+    presence = {}
+    for i, qsos in enumerate(qso_lists):
+        bit = 1 << i
+        for qso in qsos:
+            presence_key = key(qso)
+            entry = presence.get(presence_key)
+            if entry is None:
+                presence[presence_key] = [bit, qso]
+            else:
+                entry[0] |= bit
+    return presence
+
+
+class CompactQso(collections.abc.MutableMapping):
+    """
+    a QSO that takes much less memory than a dict.
+    QSOs with the same field names, in the same order, share one layout, a dict of field name to
+    position.  each QSO only has its layout and a list of its values, in layout order.
+    it reads and writes like a dict, and iterates fields in insertion order.
+    """
+    __slots__ = ('layout', 'values')
+    layouts = {}  # the layout for each distinct tuple of field names.
+    layouts_lock = threading.Lock()  # QSOs are made by read_adif_file in more than one thread.
+
+    def __init__(self, fields=None):
+        if fields:
+            self.layout = CompactQso.get_layout(tuple(fields))
+            self.values = list(fields.values())
+        else:
+            self.layout = CompactQso.get_layout(())
+            self.values = []
+
+    @classmethod
+    def from_layout(cls, layout, values):
+        """
+        make a CompactQso from a layout from get_layout() and a list of values in layout order.
+        the list is used, not copied.
+        """
+        qso = cls.__new__(cls)
+        qso.layout = layout
+        qso.values = values
+        return qso
+
+    @staticmethod
+    def get_layout(names):
+        layout = CompactQso.layouts.get(names)
+        if layout is None:
+            with CompactQso.layouts_lock:
+                layout = CompactQso.layouts.get(names)
+                if layout is None:
+                    layout = CompactQso.layouts[names] = {name: position for position, name in enumerate(names)}
+        return layout
+
+    def get(self, key, default=None):
+        position = self.layout.get(key)
+        if position is None:
+            return default
+        return self.values[position]
+
+    def __getitem__(self, key):
+        position = self.layout.get(key)
+        if position is None:
+            raise KeyError(key)
+        return self.values[position]
+
+    def __setitem__(self, key, value):
+        position = self.layout.get(key)
+        if position is None:
+            self.layout = CompactQso.get_layout(tuple(self.layout) + (key,))
+            self.values.append(value)
+        else:
+            self.values[position] = value
+
+    def __delitem__(self, key):
+        position = self.layout.get(key)
+        if position is None:
+            raise KeyError(key)
+        self.layout = CompactQso.get_layout(tuple(name for name in self.layout if name != key))
+        del self.values[position]
+
+    def __iter__(self):
+        return iter(self.layout)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
 
 
 def compare_qsos(qso1, qso2):
@@ -730,13 +1929,41 @@ def qso_timestamp(qso):
 
 
 def qso_key(qso):
-    return get_key(qso, qso_key_parts)
+    """
+    the same value as get_key(qso, qso_key_parts), built in one step instead of a loop of concatenations.
+    """
+    get = qso.get
+    return (f"{get('qso_date') or 'missing'}.{get('time_on') or 'missing'}."
+            f"{get('call') or 'missing'}.{get('band') or 'missing'}")
 
 
 def merge_key(qso):
     return get_key(qso, merge_key_parts)
 
 
+def keys_in_order(keys):
+    """
+    :param keys: list of sort keys
+    :return: True if the keys are already in ascending order.
+    """
+    return all(map(operator.le, keys, itertools.islice(keys, 1, None)))
+
+
+def sort_qsos(qsos, key=qso_key):
+    """
+    sort QSOs, computing each sort key only once.  input that is already in order,
+    like LoTW data, is only checked and not sorted.  the sort is stable.
+    :param qsos: iterable of QSOs
+    :param key: sort key function
+    :return: list of QSOs in order
+    """
+    qsos = list(qsos)
+    keys = list(map(key, qsos))
+    if keys_in_order(keys):
+        return qsos
+    return [qsos[i] for i in sorted(range(len(keys)), key=keys.__getitem__)]
+
+
 def get_key(qso, key_parts):
     key = ''
     for key_part in key_parts:
@@ -746,13 +1973,63 @@ def get_key(qso, key_parts):
     return key
 
 
-def merge(header, qsos, new_qsos):
-    qso_dict = {}
-    added_count = 0
+class QsoSortKeys:
+    """
+    read-only sequence of the sort keys of a list of QSOs, computed only when asked for,
+    so the list can be searched with bisect.
+    """
+    __slots__ = ('qsos',)
+
+    def __init__(self, qsos):
+        self.qsos = qsos
+
+    def __len__(self):
+        return len(self.qsos)
+
+    def __getitem__(self, index):
+        return qso_key(self.qsos[index])
+
+
+def insert_qsos(qsos, new_qsos):
+    """
+    merge two lists of QSOs that are both in qso_key order.  the place of each new QSO
+    is found by binary search, so only a few keys of the long list are computed.
+    new QSOs go after existing QSOs with the same key.
+    :return: new list of QSOs in qso_key order
+    """
+    keys = QsoSortKeys(qsos)
+    merged = []
+    start = 0
+    for new_qso in new_qsos:
+        end = bisect.bisect_right(keys, qso_key(new_qso), start)
+        merged.extend(qsos[start:end])
+        merged.append(new_qso)
+        start = end
+    merged.extend(qsos[start:])
+    return merged
+
+
+def qso_index(qsos):
+    """
+    :return: dict of qso_key to QSO, to pass to merge().
+    """
+    return {qso_key(qso): qso for qso in qsos}
+
+
+def merge(header, qsos, new_qsos, qso_dict=None):
+    """
+    merge new QSOs into a log.  new QSOs are added, QSOs already in the log get any changed fields.
+    :param header: adif header of the log, app_lotw_numrec is updated.
+    :param qsos: the log, list of QSOs in qso_key order.
+    :param new_qsos: QSOs to merge in.
+    :param qso_dict: index of qsos from qso_index().  it is kept current, so the same index can be
+                     passed to the next merge into the returned list.
+    :return: header, new list of QSOs in qso_key order
+    """
+    if qso_dict is None:
+        qso_dict = qso_index(qsos)
+    added_qsos = []
     updated_count = 0
-    for qso in qsos:
-        key = qso_key(qso)
-        qso_dict[key] = qso
     for new_qso in new_qsos:
         updated = False
         added = False
@@ -760,9 +2037,8 @@ def merge(header, qsos, new_qsos):
         found_qso = qso_dict.get(key)
         if found_qso is None:
             qso_dict[key] = new_qso
-            qsos.append(new_qso)
+            added_qsos.append(new_qso)
             added = True
-            added_count += 1
             logging.debug('added qso: ' + str(new_qso))
         else:
             for key in new_qso:
@@ -779,9 +2055,11 @@ def merge(header, qsos, new_qsos):
         if not added and not updated:
             logging.debug('ignoring QSO: ' + str(new_qso))
 
+    if len(added_qsos) > 0:
+        qsos = insert_qsos(qsos, sort_qsos(added_qsos))
     header['app_lotw_numrec'] = str(len(qsos))
-    logging.info(f'Added {added_count}, updated {updated_count} QSOs')
-    return header, sorted(qsos, key=lambda qso: qso_key(qso))
+    logging.info(f'Added {len(added_qsos)}, updated {updated_count} QSOs')
+    return header, qsos
 
 
 def write_adif_field(key, item):
@@ -792,71 +2070,126 @@ def write_adif_field(key, item):
         return f'<{key}>\n'
 
 
+adif_save_keys = frozenset(['app_lotw_mode',
+                            'app_lotw_modegroup',
+                            'app_n1kdo_qso_combined',
+                            'band',
+                            'call',
+                            'country',
+                            'dxcc',
+                            'gridsquare',
+                            'vucc_grids',
+                            'mode',
+                            'qso_date',
+                            'qsl_rcvd',
+                            'submode',
+                            'time_on',
+                           ])
+adif_ignore_keys = frozenset(['app_lotw_2xqsl',
+                              'app_lotw_dxcc_application_nr',
+                              'app_lotw_cqz_inferred',
+                              'app_lotw_cqz_invalid',
+                              'app_lotw_credit_granted',
+                              'app_lotw_deleted_entity',
+                              'app_lotw_dxcc_entity_status',
+                              'app_lotw_dxcc_processed_dtg',
+                              'app_lotw_npsunit',
+                              'app_lotw_owncall',
+                              'app_lotw_gridsquare_invalid',
+                              'app_lotw_ituz_inferred',
+                              'app_lotw_ituz_invalid',
+                              'app_lotw_qslmode',
+                              'app_lotw_qso_timestamp',
+                              'app_lotw_rxqsl',
+                              'app_lotw_rxqso',
+                              'band_rx',
+                              'cnty',
+                              'cqz',
+                              'credit_granted',
+                              'freq',
+                              'freq_rx',
+                              'iota',
+                              'ituz',
+                              'pfx',
+                              'qslrdate',
+                              'station_callsign',
+                              'state',
+                             ])
+
+
+def write_adif_parts(f, parts, record_name):
+    """
+    write one header or QSO record, built from parts, one for each field.
+    fields that can not be encoded in the file's encoding are left out, with a warning.
+    :param record_name: what the record is, for the warning.
+    """
+    try:
+        f.write(''.join(parts))
+    except UnicodeEncodeError:
+        # the record is encoded before any of it is written, so it can be written again without the bad fields.
+        kept_parts = []
+        for part in parts:
+            try:
+                part.encode(f.encoding)
+                kept_parts.append(part)
+            except UnicodeEncodeError:
+                logging.warning(f'not saving {part.strip()} in {record_name}, it can not be written as {f.encoding}')
+        f.write(''.join(kept_parts))
+
+
+def write_adif_stream(f, header, qsos, abridge_results=True):
+    """
+    write adif to an open file.  each QSO record is built in one string and written at once.
+    :param f: file open for writing text.
+    :param header: adif header as dict.
+    :param qsos: iterable of QSOs, can be a generator so the QSOs need not all be in memory.
+    :param abridge_results: only write the fields in adif_save_keys.
+    :return: number of QSOs written
+    """
+    f.write('n1kdo lotw-qso-analyzer adif compatible file\n\n')
+    header['programid'] = 'n1kdo log analyzer'
+    write_adif_parts(f, [write_adif_field(k, header[k]) for k in header] + ['<eoh>\n\n'], 'the header')
+    unsaved = {}  # key: [count, example value] of fields that were not saved.
+    count = 0
+    for qso in qsos:
+        parts = []
+        for key, value in qso.items():
+            if abridge_results and key not in adif_save_keys:
+                if key not in adif_ignore_keys:
+                    if key in unsaved:
+                        unsaved[key][0] += 1
+                    else:
+                        unsaved[key] = [1, value]
+            elif value is not None:
+                value = str(value)
+                parts.append(f'<{key}:{len(value)}>{value}\n')
+            else:
+                parts.append(f'<{key}>\n')
+        parts.append('<eor>\n\n')
+        write_adif_parts(f, parts, f'QSO {qso_key(qso)}')
+        count += 1
+    for key, (key_count, value) in unsaved.items():
+        logging.warning(f'not saving {key} in {key_count} QSOs, for example {value}')
+    return count
+
+
 def write_adif_file(header, qsos, adif_file_name, abridge_results=True):
+    """
+    write an adif file.  it is written to a temporary file next to it first, and only replaces
+    the old file when all of it has been written, so a failed write leaves the old file as it was.
+    """
     logging.info(f'write_adif_file {adif_file_name}')
-    save_keys = ['app_lotw_mode',
-                 'app_lotw_modegroup',
-                 'app_n1kdo_qso_combined',
-                 'band',
-                 'call',
-                 'country',
-                 'dxcc',
-                 'gridsquare',
-                 'vucc_grids',
-                 'mode',
-                 'qso_date',
-                 'qsl_rcvd',
-                 'submode',
-                 'time_on',
-                 ]
-    ignore_keys = ['app_lotw_2xqsl',
-                   'app_lotw_dxcc_application_nr',
-                   'app_lotw_cqz_inferred',
-                   'app_lotw_cqz_invalid',
-                   'app_lotw_credit_granted',
-                   'app_lotw_deleted_entity',
-                   'app_lotw_dxcc_entity_status',
-                   'app_lotw_dxcc_processed_dtg',
-                   'app_lotw_npsunit',
-                   'app_lotw_owncall',
-                   'app_lotw_gridsquare_invalid',
-                   'app_lotw_ituz_inferred',
-                   'app_lotw_ituz_invalid',
-                   'app_lotw_qslmode',
-                   'app_lotw_qso_timestamp',
-                   'app_lotw_rxqsl',
-                   'app_lotw_rxqso',
-                   'band_rx',
-                   'cnty',
-                   'cqz',
-                   'credit_granted',
-                   'freq',
-                   'freq_rx',
-                   'iota',
-                   'ituz',
-                   'pfx',
-                   'qslrdate',
-                   'station_callsign',
-                   'state',
-                   ]
-    with open(adif_file_name, 'w') as f:
-        f.write('n1kdo lotw-qso-analyzer adif compatible file\n\n')
-        header['programid'] = 'n1kdo log analyzer'
-        for k in header:
-            f.write(write_adif_field(k, header[k]))
-        f.write('<eoh>\n\n')
-        for qso in qsos:
-            for key, value in qso.items():
-                if abridge_results:
-                    if key in save_keys:
-                        f.write(write_adif_field(key, value))
-                    else:
-                        if key not in ignore_keys:
-                            logging.warning(f'not saving {key} {value}')
-                else:
-                    f.write(write_adif_field(key, value))
-            f.write('<eor>\n\n')
-    logging.info(f'wrote_adif_file {adif_file_name}')
+    temp_file_name = adif_file_name + '.tmp'
+    try:
+        # iso-8859-1 so that the field lengths are byte counts, as the reader expects.
+        with open(temp_file_name, 'w', encoding='iso-8859-1') as f:
+            count = write_adif_stream(f, header, qsos, abridge_results)
+        os.replace(temp_file_name, adif_file_name)
+    except BaseException:
+        if os.path.exists(temp_file_name):
+            os.remove(temp_file_name)
+        raise
+    logging.info(f'wrote_adif_file {adif_file_name}, {count} QSOs')
 
 
 def compare_lists(qso_list, cards_list):
@@ -871,36 +2204,181 @@ def compare_lists(qso_list, cards_list):
             logging.warning(f"can't find a match for {qso}")
 
 
+def qso_differences(left_qso, right_qso, fields=None):
+    """
+    :param fields: names of the fields to compare.  if None, the fields that both QSOs have are compared.
+    :return: list of the names of the fields that have different values.
+    """
+    if fields is None:
+        fields = [field for field in left_qso if field in right_qso]
+    return [field for field in fields if left_qso.get(field) != right_qso.get(field)]
+
+
+def qso_match_group(qso):
+    """
+    :return: (call, band, LoTW mode group) tuple that fuzzy matched QSOs must share.
+    """
+    mode = qso.get('app_lotw_modegroup')
+    if mode is None and qso.get('mode') is not None:
+        mode = adif_mode_to_lotw_modegroup(qso.get('mode'))
+    return (qso.get('call') or '').upper(), (qso.get('band') or '').upper(), mode or ''
+
+
+def qso_seconds(qso, day_epochs=None):
+    """
+    :param day_epochs: optional dict cache of qso_date to its epoch seconds.
+    :return: qso_date and time_on as seconds since the epoch, midnight if there is no time_on,
+             None if there is no valid qso_date.
+    """
+    qso_date = qso.get('qso_date') or ''
+    day_epoch = day_epochs.get(qso_date) if day_epochs is not None else None
+    if day_epoch is None:
+        try:
+            day_epoch = calendar.timegm(datetime.datetime.strptime(qso_date, '%Y%m%d').timetuple())
+        except ValueError:
+            return None
+        if day_epochs is not None:
+            day_epochs[qso_date] = day_epoch
+    qso_time = qso.get('time_on') or ''
+    if len(qso_time) < 4 or not qso_time.isdigit():
+        return day_epoch
+    return day_epoch + int(qso_time[0:2]) * 3600 + int(qso_time[2:4]) * 60 + int(qso_time[4:6] or '0')
+
+
+def match_qsos(left_qsos, right_qsos, tolerance=60):
+    """
+    pair the QSOs of two logs that have the same call, band and mode group, and times no more than
+    tolerance seconds apart.  both logs are sorted by (group, time), then walked together with a
+    sliding window, pairing each left QSO with the earliest unpaired right QSO in its window,
+    so this is O(n log n) and not an all-pairs comparison.
+    :param left_qsos: iterable of QSOs
+    :param right_qsos: iterable of QSOs
+    :param tolerance: the most seconds that the times of paired QSOs can differ by.
+    :return: list of (left QSO, right QSO) pairs, list of left only QSOs, list of right only QSOs.
+             the pairs and left only QSOs are in left log order, right only QSOs in right log order.
+             QSOs without a valid qso_date are never paired.
+    """
+    day_epochs = {}
+    sides = []
+    for qsos in (left_qsos, right_qsos):
+        qsos = list(qsos)
+        entries = []
+        for index, qso in enumerate(qsos):
+            seconds = qso_seconds(qso, day_epochs)
+            if seconds is not None:
+                entries.append((qso_match_group(qso), seconds, index))
+        entries.sort()
+        sides.append((qsos, entries))
+    (left, left_entries), (right, right_entries) = sides
+
+    right_of_left = {}
+    right_paired = set()
+    i = 0
+    j = 0
+    while i < len(left_entries) and j < len(right_entries):
+        left_group, left_seconds, left_index = left_entries[i]
+        right_group, right_seconds, right_index = right_entries[j]
+        if right_group < left_group or (right_group == left_group and right_seconds < left_seconds - tolerance):
+            j += 1  # this right QSO is before the window of every remaining left QSO.
+        elif right_group > left_group or right_seconds > left_seconds + tolerance:
+            i += 1  # no right QSO is in this left QSO's window.
+        else:
+            right_of_left[left_index] = right_index
+            right_paired.add(right_index)
+            i += 1
+            j += 1
+
+    pairs = [(left[index], right[right_of_left[index]]) for index in sorted(right_of_left)]
+    left_only = [qso for index, qso in enumerate(left) if index not in right_of_left]
+    right_only = [qso for index, qso in enumerate(right) if index not in right_paired]
+    return pairs, left_only, right_only
+
+
+def diff_qsos(left_qsos, right_qsos, key=qso_key, fields=None, tolerance=None):
+    """
+    compare two logs.  QSOs are matched on key with a hash join, in linear time, or when tolerance
+    is set, on call, band, mode group and time with match_qsos().
+    when a key is on more than one QSO in the right log, left QSOs are compared to the first of them.
+    :param left_qsos: iterable of QSOs
+    :param right_qsos: iterable of QSOs
+    :param key: function that makes the key QSOs are matched on
+    :param fields: names of the fields to compare on matched QSOs, see qso_differences()
+    :param tolerance: if not None, match QSOs with times up to this many seconds apart, and ignore key.
+    :return: list of left only QSOs, list of right only QSOs,
+             list of (left QSO, right QSO, names of fields that differ) for matched QSOs that differ.
+             each list is in the order of the log its QSOs came from.
+    """
+    if tolerance is not None:
+        pairs, left_only, right_only = match_qsos(left_qsos, right_qsos, tolerance)
+    else:
+        left = [(key(qso), qso) for qso in left_qsos]
+        right = [(key(qso), qso) for qso in right_qsos]
+        right_dict = {}
+        for right_key, right_qso in right:
+            if right_key not in right_dict:
+                right_dict[right_key] = right_qso
+        left_keys = set()
+        left_only = []
+        pairs = []
+        for left_key, left_qso in left:
+            left_keys.add(left_key)
+            right_qso = right_dict.get(left_key)
+            if right_qso is None:
+                left_only.append(left_qso)
+            else:
+                pairs.append((left_qso, right_qso))
+        right_only = [right_qso for right_key, right_qso in right if right_key not in left_keys]
+    different = []
+    for left_qso, right_qso in pairs:
+        different_fields = qso_differences(left_qso, right_qso, fields)
+        if len(different_fields) > 0:
+            different.append((left_qso, right_qso, different_fields))
+    return left_only, right_only, different
+
+
 def combine_qsos(qso_list, qsl_cards):
+    """
+    add the QSL card data to the matching QSOs, and add the cards that match no QSO.
+    the QSOs are found through a dict of merge_key to the QSOs with that key, in list order.
+    :param qso_list: list of QSOs, cards that are added are appended to it.
+    :param qsl_cards: list of QSL cards
+    :return: the QSOs in qso_key order
+    """
     logging.debug('combining dxcc qsl card info')
-    # build index of qsos
+    qsos_by_merge_key = {}
+    for qso in qso_list:
+        key = merge_key(qso)
+        key_qsos = qsos_by_merge_key.get(key)
+        if key_qsos is None:
+            qsos_by_merge_key[key] = [qso]
+        else:
+            key_qsos.append(qso)
 
-    # this is brute-force right now.  it could be made faster.
     updated_qsls = []
     added_qsls = []
     for card in qsl_cards:
         card_merge_key = get_key(card, merge_key_parts)
         found = False
-        for qso in qso_list:
-            if card_merge_key == merge_key(qso):
-                qsl_rcvd = (qso.get('qsl_rcvd') or 'n').lower()
-                if qsl_rcvd != 'y':
-                    break
-                if found:  # have already seen this qsl
-                    logging.warning(f'already seen {card_merge_key} {str(qso)} {str(card)} ')
-                found = True
-                for k in card:
-                    if k not in merge_key_parts:
-                        qso[k] = card[k]
-                updated_qsls.append(qso)
+        for qso in qsos_by_merge_key.get(card_merge_key, ()):
+            qsl_rcvd = (qso.get('qsl_rcvd') or 'n').lower()
+            if qsl_rcvd != 'y':
+                break
+            if found:  # have already seen this qsl
+                logging.warning(f'already seen {card_merge_key} {str(qso)} {str(card)} ')
+            found = True
+            for k in card:
+                if k not in merge_key_parts:
+                    qso[k] = card[k]
+            updated_qsls.append(qso)
         if not found:
             # logging.info(f'QSL added from card: {card["call"]} {card["band"]} {card["qso_date"]} {card["country"]}')
             card['app_n1kdo_qso_combined'] = 'qslcards QSL added'
             card['qsl_rcvd'] = 'y'
             added_qsls.append(card)
             qso_list.append(card)
+            qsos_by_merge_key.setdefault(card_merge_key, []).append(card)
     logging.info(f'updated {len(updated_qsls)} QSL from cards, added {len(added_qsls)} QSLs from cards')
-    return qso_list
+    return sort_qsos(qso_list)
 
 
 def copy_qso_data(qso_from, qso_to, key):
@@ -909,3 +2387,172 @@ def copy_qso_data(qso_from, qso_to, key):
         qso_to[key] = data
     else:
         logging.warning(f'no key {key} in {qso_from}')
+
+
+class QsoStore:
+    """
+    QSOs kept in a local SQLite database file.
+    each QSO is stored as JSON, with its qso_key, merge_key, qso_date, dxcc and grid
+    in indexed columns, so lookups and date ranges do not scan the whole log.
+    QSOs come back in qso_key order.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.connection = sqlite3.connect(file_name)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS header (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS qsos (id INTEGER PRIMARY KEY,
+                                             qso_key TEXT NOT NULL,
+                                             merge_key TEXT NOT NULL,
+                                             qso_date TEXT,
+                                             dxcc TEXT,
+                                             grid TEXT,
+                                             fields TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS qsos_qso_key ON qsos (qso_key);
+            CREATE INDEX IF NOT EXISTS qsos_merge_key ON qsos (merge_key);
+            CREATE INDEX IF NOT EXISTS qsos_qso_date ON qsos (qso_date);
+            CREATE INDEX IF NOT EXISTS qsos_dxcc ON qsos (dxcc);
+            CREATE INDEX IF NOT EXISTS qsos_grid ON qsos (grid);
+        """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM qsos').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def _columns(qso):
+        grid = qso.get('gridsquare')
+        return (qso_key(qso),
+                merge_key(qso),
+                qso.get('qso_date'),
+                qso.get('dxcc'),
+                grid[0:4].upper() if grid is not None else None,
+                json.dumps(dict(qso), default=str))
+
+    def _select(self, where='', params=()):
+        for row in self.connection.execute(f'SELECT fields FROM qsos {where} ORDER BY qso_key, id', params):
+            yield json.loads(row[0])
+
+    def get_header(self):
+        return dict(self.connection.execute('SELECT name, value FROM header'))
+
+    def save_header(self, header):
+        with self.connection:
+            self.connection.execute('DELETE FROM header')
+            self.connection.executemany('INSERT INTO header (name, value) VALUES (?, ?)',
+                                        [(k, str(v) if v is not None else None) for k, v in header.items()])
+
+    def add_qsos(self, qsos):
+        """
+        add QSOs without looking for existing ones, for loading a new store.
+        """
+        with self.connection:
+            self.connection.executemany('INSERT INTO qsos (qso_key, merge_key, qso_date, dxcc, grid, fields) '
+                                        'VALUES (?, ?, ?, ?, ?, ?)', map(self._columns, qsos))
+
+    def qsos(self, start_date=None, end_date=None):
+        """
+        :param start_date: datetime.date of the first QSO date to include, or None.
+        :param end_date: datetime.date of the day after the last QSO date to include, or None.
+        :return: generator of QSO dicts in qso_key order.
+        """
+        conditions = []
+        params = []
+        if start_date is not None:
+            conditions.append('qso_date >= ?')
+            params.append(start_date.strftime('%Y%m%d'))
+        if end_date is not None:
+            conditions.append('qso_date < ?')
+            params.append(end_date.strftime('%Y%m%d'))
+        return self._select('WHERE ' + ' AND '.join(conditions) if conditions else '', params)
+
+    def qsos_for_dxcc(self, dxcc):
+        return self._select('WHERE dxcc = ?', (dxcc,))
+
+    def qsos_for_grid(self, grid):
+        return self._select('WHERE grid = ?', (grid[0:4].upper(),))
+
+    def merge(self, header, new_qsos):
+        """
+        the same as merge(), but each new QSO is looked up with the qso_key index.
+        :return: the header, which is also saved in the store.
+        """
+        added_count = 0
+        updated_count = 0
+        connection = self.connection
+        with connection:
+            for new_qso in new_qsos:
+                key = qso_key(new_qso)
+                # merge() keeps the last QSO seen with a key.
+                row = connection.execute('SELECT id, fields FROM qsos WHERE qso_key = ? ORDER BY id DESC LIMIT 1',
+                                         (key,)).fetchone()
+                if row is None:
+                    connection.execute('INSERT INTO qsos (qso_key, merge_key, qso_date, dxcc, grid, fields) '
+                                       'VALUES (?, ?, ?, ?, ?, ?)', self._columns(new_qso))
+                    added_count += 1
+                    logging.debug('added qso: ' + str(new_qso))
+                    continue
+                found_qso = json.loads(row[1])
+                updated = False
+                for k in new_qso:
+                    if k not in qso_key_parts and found_qso.get(k) != new_qso.get(k):
+                        updated = True
+                        found_qso[k] = new_qso.get(k)
+                        logging.debug(f'updating {k} with {new_qso.get(k)}')
+                if updated:
+                    self._update(row[0], found_qso)
+                    updated_count += 1
+                    logging.debug('updated QSO: ' + str(found_qso))
+                else:
+                    logging.debug('found existing QSO ' + str(found_qso))
+        header['app_lotw_numrec'] = str(len(self))
+        self.save_header(header)
+        logging.info(f'Added {added_count}, updated {updated_count} QSOs')
+        return header
+
+    def combine_qsos(self, qsl_cards):
+        """
+        the same as combine_qsos(), but the QSOs for each card are found with the merge_key index.
+        """
+        logging.debug('combining dxcc qsl card info')
+        updated_count = 0
+        added_count = 0
+        connection = self.connection
+        with connection:
+            for card in qsl_cards:
+                card_merge_key = merge_key(card)
+                found = False
+                for row_id, fields in connection.execute('SELECT id, fields FROM qsos WHERE merge_key = ? '
+                                                         'ORDER BY qso_key, id', (card_merge_key,)).fetchall():
+                    qso = json.loads(fields)
+                    qsl_rcvd = (qso.get('qsl_rcvd') or 'n').lower()
+                    if qsl_rcvd != 'y':
+                        break
+                    if found:  # have already seen this qsl
+                        logging.warning(f'already seen {card_merge_key} {str(qso)} {str(card)} ')
+                    found = True
+                    for k in card:
+                        if k not in merge_key_parts:
+                            qso[k] = card[k]
+                    self._update(row_id, qso)
+                    updated_count += 1
+                if not found:
+                    card['app_n1kdo_qso_combined'] = 'qslcards QSL added'
+                    card['qsl_rcvd'] = 'y'
+                    connection.execute('INSERT INTO qsos (qso_key, merge_key, qso_date, dxcc, grid, fields) '
+                                       'VALUES (?, ?, ?, ?, ?, ?)', self._columns(card))
+                    added_count += 1
+        logging.info(f'updated {updated_count} QSL from cards, added {added_count} QSLs from cards')
+
+    def _update(self, row_id, qso):
+        self.connection.execute('UPDATE qsos SET qso_key = ?, merge_key = ?, qso_date = ?, dxcc = ?, grid = ?, '
+                                'fields = ? WHERE id = ?', self._columns(qso) + (row_id,))
@@ -37,8 +37,11 @@ import logging
 import os
 import time
 
+import numpy as np
+
 import adif
 import qso_charts
+import qso_table
 
 __author__ = 'Jeffrey B. Otterson, N1KDO'
 __copyright__ = 'Copyright 2017 - 2024 Jeffrey B. Otterson'
@@ -87,6 +90,8 @@ FFMA_GRIDS = ['CM79', 'CM86', 'CM87', 'CM88', 'CM89', 'CM93', 'CM94', 'CM95', 'C
               'FN32', 'FN33', 'FN34', 'FN35', 'FN41', 'FN42', 'FN43', 'FN44', 'FN45', 'FN46', 'FN51', 'FN53',
               'FN54', 'FN55', 'FN56', 'FN57', 'FN64', 'FN65', 'FN66', 'FN67']
 
+CHALLENGE_BANDS = ['160M', '80M', '40M', '30M', '20M', '17M', '15M', '12M', '10M', '6M']
+
 charts_dir = 'charts/'
 
 
@@ -118,37 +123,45 @@ def get_yes_no(prompt, default=None):
                 return default
 
 
+def qso_datetime(qso):
+    """
+    :return: the time of the QSO as a datetime, from app_lotw_qso_timestamp, or from qso_date and time_on.
+    """
+    app_lotw_qso_timestamp = qso.get('app_lotw_qso_timestamp')
+    if app_lotw_qso_timestamp is None:
+        qso_date = qso.get('qso_date')
+        qso_time = qso.get('time_on') or ''
+        if len(qso_time) != 6:
+            qso_time = '120000'  # if no date, make midday
+        qso_iso_date = qso_date[0:4] + '-' + qso_date[4:6] + '-' + qso_date[6:8]
+        qso_iso_date += 'T' + qso_time[0:2] + ':' + qso_time[2:4] + ':' + qso_time[4:6] + '+00:00'
+        return datetime.datetime.fromisoformat(qso_iso_date)
+    if isinstance(app_lotw_qso_timestamp, str):
+        return datetime.datetime.fromisoformat(app_lotw_qso_timestamp.replace('Z', '+00:00'))
+    return app_lotw_qso_timestamp
+
+
 def crunch_data(qso_list):
+    """
+    count QSOs into time bins for the charts, and print the summary.
+    the QSOs are put in a qso_table.QsoTable, and the counts are made on its columns.
+    only the VUCC grids are counted one QSO at a time, from the 6M QSOs.
+    :param qso_list: list of QSO dicts, it is not changed.
+    :return: qso_charts.BinnedQSOData
+    """
     #    print_csv_data = get_yes_no('Show CSV data for Excel [y/N] : ', False)
     logging.debug('crunch_data')
     logging.info('%5d total LoTW QSOs' % len(qso_list))
-    # sort list of QSOs into ascending range by qso_date
-    # qso_list.sort(key=lambda q: q['qso_date'])
-    for qso in qso_list:
-        app_lotw_qso_timestamp = qso.get('app_lotw_qso_timestamp')
-        if app_lotw_qso_timestamp is None:
-            #logging.warning('app_lotw_qso_timestamp is None')
-            qso_date = qso.get('qso_date')
-            qso_time = qso.get('time_on') or ''
-            if len(qso_time) != 6:
-                qso_time = '120000'  # if no date, make midday
-            qso_iso_date = qso_date[0:4] + '-' + qso_date[4:6] + '-' + qso_date[6:8]
-            qso_iso_date += 'T' + qso_time[0:2] + ':' + qso_time[2:4] + ':' + qso_time[4:6] + '+00:00'
-            dt = datetime.datetime.fromisoformat(qso_iso_date)
-            qso['app_lotw_qso_timestamp'] = dt
-            # could/should create this here if missing
-        else:
-            if isinstance(app_lotw_qso_timestamp, str):
-                app_lotw_qso_timestamp = app_lotw_qso_timestamp.replace('Z', '+00:00')
-                qso['app_lotw_qso_timestamp'] = datetime.datetime.fromisoformat(app_lotw_qso_timestamp)
-            elif not isinstance(app_lotw_qso_timestamp, datetime.datetime):
-                logging.error(f'app_lotw_qso_timestamp is of type {type(app_lotw_qso_timestamp)}')
-
-    qso_list.sort(key=lambda q: q['app_lotw_qso_timestamp'])
+    table = qso_table.QsoTable.from_qsos(qso_list)
+    # the QSO dicts for the table rows
+    positions = np.arange(len(table))
+    if (np.diff(table.timestamp) < 0).any():
+        positions = np.argsort(table.timestamp, kind='stable')
+        table = table.take(positions)
 
     # now this can be binned.
-    first_datetime = qso_list[0]['app_lotw_qso_timestamp']
-    last_datetime = qso_list[-1]['app_lotw_qso_timestamp']
+    first_datetime = qso_datetime(qso_list[positions[0]])
+    last_datetime = qso_datetime(qso_list[positions[-1]])
 
     # always start on a day boundary
     first_datetime = first_datetime.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -156,301 +169,189 @@ def crunch_data(qso_list):
 
     bin_data = qso_charts.BinnedQSOData(first_datetime, last_datetime)
 
+    num_bands = len(adif.BANDS)
+    num_modes = len(adif.MODES)
+    band = table.band.astype(np.int64)
+    mode = table.mode.astype(np.int64)
+    dxcc = table.dxcc.astype(np.int64)
+    for i in np.flatnonzero(band < 0):
+        logging.warning('empty band data in qso:' + str(qso_list[positions[i]]))
+    for i in np.flatnonzero((band >= 0) & (mode < 0)):
+        logging.warning('unknown mode in qso:' + str(qso_list[positions[i]]))
+    counted = (band >= 0) & (mode >= 0) & (table.qso_date != 0)
+    confirmed = counted & table.confirmed
+
+    # the first confirmed QSO with a DXCC entity is a new DXCC,
+    # and the first on each challenge band is a challenge QSO.
+    # the dxcc codes index table.dxccs, the dxcc strings, which are looked up just as they are.
+    num_dxcc = len(table.dxccs)
+    dxcc_names = [(adif.dxcc_countries.get(code) or ('None', False))[0] for code in table.dxccs]
+    dxcc_known = np.array([code in adif.dxcc_countries for code in table.dxccs], dtype=np.bool_)
+    dxcc_counted = np.array([code != '0' and not (adif.dxcc_countries.get(code) or ('None', False))[1]
+                             for code in table.dxccs], dtype=np.bool_)
+    dxcc_qsos = np.flatnonzero(confirmed & dxcc_counted[dxcc])
+    dxcc_codes, first_qsos = np.unique(dxcc[dxcc_qsos], return_index=True)
+    first_qsos = dxcc_qsos[first_qsos]
+    new_dxcc = np.zeros(len(table), dtype=np.bool_)
+    new_dxcc[first_qsos[dxcc_known[dxcc_codes]]] = True
+
+    challenge_band_index = np.full(num_bands, -1)
+    for i, band_name in enumerate(CHALLENGE_BANDS):
+        challenge_band_index[qso_table.BAND_CODES[band_name]] = i
+    challenge_qsos = dxcc_qsos[challenge_band_index[band[dxcc_qsos]] >= 0]
+    _, first_challenge_qsos = np.unique(dxcc[challenge_qsos] * num_bands + band[challenge_qsos], return_index=True)
+    challenge = np.zeros(len(table), dtype=np.bool_)
+    challenge[challenge_qsos[first_challenge_qsos]] = True
+
+    dxcc_mixed = np.bincount(dxcc[dxcc_qsos], minlength=num_dxcc)
+    dxcc_modes = np.bincount(dxcc[dxcc_qsos] * num_modes + mode[dxcc_qsos],
+                             minlength=num_dxcc * num_modes).reshape(num_dxcc, num_modes)
+    dxcc_bands = np.bincount(dxcc[dxcc_qsos] * num_bands + band[dxcc_qsos],
+                             minlength=num_dxcc * num_bands).reshape(num_dxcc, num_bands)
     dxcc_confirmed = {}
+    for code in dxcc[np.sort(first_qsos)].tolist():
+        dxcc_counts = {'COUNTRY': dxcc_names[code],
+                       'DXCC': table.dxccs[code],
+                       'MIXED': int(dxcc_mixed[code]),
+                       }
+        for mode_name in ['CW', 'PHONE', 'DATA']:
+            dxcc_counts[mode_name] = int(dxcc_modes[code, qso_table.MODE_CODES[mode_name]])
+        for band_name in CHALLENGE_BANDS:
+            dxcc_counts[band_name] = int(dxcc_bands[code, qso_table.BAND_CODES[band_name]])
+        dxcc_confirmed[table.dxccs[code]] = dxcc_counts
+
+    # count the 6M grids worked, in time order.
     grids = {}
-    total_counts = {'date': 'total', 'worked': 0, 'confirmed': 0, 'new_dxcc': 0, 'challenge': 0, 'ffma': 0, 'vucc': 0}
-    for band in adif.BANDS:
-        total_counts[band] = 0
-        total_counts['challenge_' + band] = 0
-        for mode in adif.MODES:
-            total_counts[f'{band}_{mode}'] = 0
-    for mode in adif.MODES:
-        total_counts[mode] = 0
-
-    unique_calls = {}
-    first_date = None
-    last_date = None
-    n_worked = 0
-    n_confirmed = 0
-    n_challenge = 0
-
-    date_records = {}  # key is qso date.  value is dict, first record is summary data.
-    # initialize data
-    key_names = ['challenge', 'confirmed', 'new_dxcc', 'worked', 'ffma', 'vucc']
-    for band in adif.BANDS:
-        key_names.append(band)
-        key_names.append('challenge_' + band)
-    for mode in adif.MODES:
-        key_names.append(mode)
-    for i in range(0, bin_data.num_bins):
-        for key_name in key_names:
-            bin_data.data[i][key_name] = 0
-
-    for qso in qso_list:
-        app_lotw_qso_timestamp = qso.get('app_lotw_qso_timestamp')
-        bin_num = bin_data.get_bin(app_lotw_qso_timestamp)
-        bin_dict = bin_data.data[bin_num]
-        qso_date = qso.get('qso_date')
-        qso_band = (qso.get('band') or '').upper()
-        if qso_band == '':
-            logging.warning('empty band data in qso:' + str(qso))
-            continue
-
-        if qso_date is not None:
-            confirmed = 0
-            new_dxcc = 0
-            challenge = 0
-            vucc = 0
-            ffma = 0
-            n_worked += 1
-
-            qso_dxcc = qso.get('dxcc') or '0'
-            lotw_qsl_rcvd = (qso.get('lotw_qsl_rcvd') or 'N').lower()
-            if lotw_qsl_rcvd == 'y':
-                confirmed = 1
-            qsl_rcvd = (qso.get('qsl_rcvd') or 'N').lower()
-            if qsl_rcvd == 'y':
-                confirmed = 1
-
-            dxcc_lookup_tuple = adif.dxcc_countries.get(qso_dxcc) or ('None', False)
-            dxcc_name = dxcc_lookup_tuple[0]
-            deleted = dxcc_lookup_tuple[1]
-            mode = qso.get('app_lotw_modegroup')
-            if mode is None:
-                mode = adif.adif_mode_to_lotw_modegroup(qso.get('mode'))
-
-            if mode not in adif.MODES:
-                logging.warning('unknown mode {} in qso:'.format(mode) + str(qso))
-
-            if qso_dxcc is not None and qso_dxcc != '0' and deleted is False:
-                if confirmed == 1:
-                    if qso_dxcc not in dxcc_confirmed:
-                        dxcc_country = adif.dxcc_countries.get(qso_dxcc) or ('error', True)
-                        deleted = dxcc_country[1]
-                        if not deleted:
-                            new_dxcc = 1
-                        dxcc_confirmed[qso_dxcc] = {
-                            'COUNTRY': dxcc_name,
-                            'DXCC': qso_dxcc,
-                            'MIXED': 0,
-                            'CW': 0,
-                            'PHONE': 0,
-                            'DATA': 0,
-                            '160M': 0,
-                            '80M': 0,
-                            '40M': 0,
-                            '30M': 0,
-                            '20M': 0,
-                            '17M': 0,
-                            '15M': 0,
-                            '12M': 0,
-                            '10M': 0,
-                            '6M': 0
-                        }
-                    dxcc_counts = dxcc_confirmed[qso_dxcc]
-                    dxcc_counts['MIXED'] = dxcc_counts['MIXED'] + 1
-                    if mode in dxcc_counts:
-                        dxcc_counts[mode] = dxcc_counts[mode] + 1
-                    if qso_band in dxcc_counts:
-                        if dxcc_counts[qso_band] == 0:
-                            challenge = 1
-                        dxcc_counts[qso_band] = dxcc_counts[qso_band] + 1
-
-            if qso_band == '6M':
-                qso_grids = []
-                vucc_grids = qso.get('vucc_grids')
-                if vucc_grids is not None:
-                    vucc_grids = vucc_grids.split(',')
-                    for vucc_grid in vucc_grids:
-                        qso_grids.append(vucc_grid[0:4])
-                if len(qso_grids) == 0:
-                    gridsquare = qso.get('gridsquare')
-                    if gridsquare is not None:
-                        qso_grids.append(gridsquare[0:4])
-                for qso_grid in qso_grids:
-                    grid_count = grids.get(qso_grid)
-                    if grid_count is None:
-                        grid_count = 1
-                        vucc += 1
-                        if qso_grid in FFMA_GRIDS:
-                            ffma += 1
-                    else:
-                        grid_count += 1
-                    grids[qso_grid] = grid_count
-
-            n_confirmed += confirmed
-            n_challenge += challenge
-
-            if qso_date is not None:
-                qdate = convert_qso_date(qso_date)
-                if qdate in date_records:
-                    counts = date_records[qdate]
-                else:
-                    counts = {'qdate': qdate, 'worked': 0, 'confirmed': 0,
-                              'new_dxcc': 0, 'challenge': 0, 'ffma': 0, 'vucc': 0}
-                    for band in adif.BANDS:
-                        counts[band] = 0
-                        counts['challenge_' + band] = 0
-                    for mode_name in adif.MODES:
-                        counts[mode_name] = 0
-                    date_records[qdate] = counts
-
-                if counts['qdate'] != qdate:
-                    logging.error('ow ow ow!')  # this is bad bad bad
-                counts['worked'] += 1
-                counts['confirmed'] += confirmed
-                counts['new_dxcc'] += new_dxcc
-                counts['challenge'] += challenge
-                counts['ffma'] += ffma
-                counts['vucc'] += vucc
-                counts[mode] += 1
-
-                bin_dict['worked'] += 1
-                bin_dict['confirmed'] += confirmed
-                bin_dict['new_dxcc'] += new_dxcc
-                bin_dict['challenge'] += challenge
-                bin_dict['ffma'] += ffma
-                bin_dict['vucc'] += vucc
-                bin_dict[qso_band] += 1
-                bin_dict[mode] += 1
-                bin_dict['challenge_' + qso_band] += challenge
-
-                total_counts['worked'] += 1
-                total_counts['confirmed'] += confirmed
-                total_counts['new_dxcc'] += new_dxcc
-                total_counts['challenge'] += challenge
-                total_counts['ffma'] += ffma
-                total_counts['vucc'] += vucc
-
-                if qso_band != '':
-                    counts['challenge_' + qso_band] += challenge
-                    counts[qso_band] += 1
-                    total_counts['challenge_' + qso_band] += challenge
-                    total_counts[qso_band] += 1
-                    total_counts[f'{qso_band}_{mode}'] += 1
-                total_counts[mode] += 1
-
-                if last_date is None or qdate > last_date:
-                    last_date = qdate
-                if first_date is None or qdate < first_date:
-                    first_date = qdate
-
-                call = qso['call']
-                if call not in unique_calls:
-                    unique_calls[call] = [qso]
-                else:
-                    unique_calls[call].append(qso)
+    vucc = np.zeros(len(table), dtype=np.int64)
+    ffma = np.zeros(len(table), dtype=np.int64)
+    for i in np.flatnonzero(counted & (band == qso_table.BAND_CODES['6M'])).tolist():
+        qso = qso_list[positions[i]]
+        qso_grids = []
+        vucc_grids = qso.get('vucc_grids')
+        if vucc_grids is not None:
+            vucc_grids = vucc_grids.split(',')
+            for vucc_grid in vucc_grids:
+                qso_grids.append(vucc_grid[0:4])
+        if len(qso_grids) == 0:
+            gridsquare = qso.get('gridsquare')
+            if gridsquare is not None:
+                qso_grids.append(gridsquare[0:4])
+        for qso_grid in qso_grids:
+            grid_count = grids.get(qso_grid)
+            if grid_count is None:
+                grid_count = 1
+                vucc[i] += 1
+                if qso_grid in FFMA_GRIDS:
+                    ffma[i] += 1
             else:
-                logging.warning("Invalid QSO record has no date ", qso)
+                grid_count += 1
+            grids[qso_grid] = grid_count
+
+    # count everything into the bins.
+    num_bins = bin_data.num_bins
+    bins = (table.timestamp - bin_data.offset) // bin_data.bin_size
+
+    def bin_counts(selected, weights=None):
+        if weights is None:
+            return np.bincount(bins[selected], minlength=num_bins)
+        return np.bincount(bins[selected], weights=weights[selected], minlength=num_bins).astype(np.int64)
+
+    bin_worked = bin_counts(counted)
+    bin_confirmed = bin_counts(confirmed)
+    bin_new_dxcc = bin_counts(new_dxcc)
+    bin_challenge = bin_counts(challenge)
+    bin_vucc = bin_counts(counted, vucc)
+    bin_ffma = bin_counts(counted, ffma)
+    bin_bands = np.bincount(bins[counted] * num_bands + band[counted],
+                            minlength=num_bins * num_bands).reshape(num_bins, num_bands)
+    bin_challenge_bands = np.bincount(bins[challenge] * num_bands + band[challenge],
+                                      minlength=num_bins * num_bands).reshape(num_bins, num_bands)
+    bin_modes = np.bincount(bins[counted] * num_modes + mode[counted],
+                            minlength=num_bins * num_modes).reshape(num_bins, num_modes)
+
+    key_names = ['challenge', 'confirmed', 'new_dxcc', 'worked', 'ffma', 'vucc']
+    columns = [bin_challenge, bin_confirmed, bin_new_dxcc, bin_worked, bin_ffma, bin_vucc]
+    for i, band_name in enumerate(adif.BANDS):
+        key_names.append(band_name)
+        columns.append(bin_bands[:, i])
+        key_names.append('challenge_' + band_name)
+        columns.append(bin_challenge_bands[:, i])
+    for i, mode_name in enumerate(adif.MODES):
+        key_names.append(mode_name)
+        columns.append(bin_modes[:, i])
+    # running totals
+    key_names += ['total_worked', 'total_confirmed', 'total_dxcc', 'total_challenge', 'total_vucc', 'total_ffma']
+    columns += [np.cumsum(column) for column in (bin_worked, bin_confirmed, bin_new_dxcc, bin_challenge,
+                                                 bin_vucc, bin_ffma)]
+    for bin_dict, row in zip(bin_data.data, np.column_stack(columns).tolist()):
+        bin_dict.update(zip(key_names, row))
+
+    band_modes = np.bincount(band[counted] * num_modes + mode[counted],
+                             minlength=num_bands * num_modes).reshape(num_bands, num_modes)
+    band_totals = band_modes.sum(axis=1)
+    mode_totals = dict(zip(adif.MODES, band_modes.sum(axis=0).tolist()))
+    challenge_totals = np.bincount(band[challenge], minlength=num_bands)
+    qso_dates, qso_date_counts = np.unique(table.qso_date[counted], return_counts=True)
+    first_date = convert_qso_date(str(qso_dates[0]))
+    last_date = convert_qso_date(str(qso_dates[-1]))
+    call_counts = np.bincount(table.call[counted], minlength=len(table.calls))
 
     print()
-    print('%5d counted worked' % n_worked)
-    print(f'{len(unique_calls):5d} unique calls')
-    print('%5d confirmed' % n_confirmed)
-    print('%5d challenge' % n_challenge)
-    for band in adif.BANDS:
-        c = int(total_counts['challenge_' + band])
+    print('%5d counted worked' % np.count_nonzero(counted))
+    print(f'{np.count_nonzero(call_counts):5d} unique calls')
+    print('%5d confirmed' % np.count_nonzero(confirmed))
+    print('%5d challenge' % np.count_nonzero(challenge))
+    for i, band_name in enumerate(adif.BANDS):
+        c = int(challenge_totals[i])
         if c > 0:
-            print('{:5d} {}'.format(c, band))
+            print('{:5d} {}'.format(c, band_name))
     print('%5d total dxcc' % len(dxcc_confirmed))
     print()
     print('             QSOs band/mode')
     print('  BAND     CW   DATA  IMAGE  PHONE  TOTAL')
-    for band in adif.BANDS:
-        c = int(total_counts[band])
+    for i, band_name in enumerate(adif.BANDS):
+        c = int(band_totals[i])
         if c > 0:
-            cw = total_counts[f'{band}_CW']
-            data = total_counts[f'{band}_DATA']
-            image = total_counts[f'{band}_IMAGE']
-            phone = total_counts[f'{band}_PHONE']
-            print(f'{band:>6s}  {cw:5d}  {data:5d}  {image:5d}  {phone:5d}  {c:5d}')
-
-    cw = total_counts[f'CW']
-    data = total_counts[f'DATA']
-    image = total_counts[f'IMAGE']
-    phone = total_counts[f'PHONE']
+            cw, data, image, phone = (int(band_modes[i, qso_table.MODE_CODES[mode_name]])
+                                      for mode_name in ['CW', 'DATA', 'IMAGE', 'PHONE'])
+            print(f'{band_name:>6s}  {cw:5d}  {data:5d}  {image:5d}  {phone:5d}  {c:5d}')
+
+    cw = mode_totals['CW']
+    data = mode_totals['DATA']
+    image = mode_totals['IMAGE']
+    phone = mode_totals['PHONE']
     c = cw + data + image + phone
     print(f' TOTAL  {cw:5d}  {data:5d}  {image:5d}  {phone:5d}  {c:5d}')
 
     print()
-    print('%5d unique log dates' % len(date_records))
+    print('%5d unique log dates' % len(qso_dates))
     print('first QSO date: ' + first_date.strftime('%Y-%m-%d'))
     print('last QSO date: ' + last_date.strftime('%Y-%m-%d'))
     print()
 
-    # now calculate running totals by date
-    total_worked = 0
-    total_confirmed = 0
-    total_new_dxcc = 0
-    total_new_challenge = 0
-
-    for qdate in sorted(date_records.keys()):
-        counts = date_records[qdate]
-        total_worked += counts['worked']
-        total_confirmed += counts['confirmed']
-        total_new_dxcc += counts['new_dxcc']
-        total_new_challenge += counts['challenge']
-        counts['total_worked'] = total_worked
-        counts['total_confirmed'] = total_confirmed
-        counts['total_new_dxcc'] = total_new_dxcc
-        counts['total_challenge'] = total_new_challenge
-
-    total_worked = 0
-    total_confirmed = 0
-    total_dxcc = 0
-    total_challenge = 0
-    total_vucc = 0
-    total_ffma = 0
-    for bin_num in range(0, bin_data.num_bins):
-        bin_dict = bin_data.data[bin_num]
-        total_worked += bin_dict['worked']
-        total_confirmed += bin_dict['confirmed']
-        total_dxcc += bin_dict['new_dxcc']
-        total_challenge += bin_dict['challenge']
-        total_vucc += bin_dict['vucc']
-        total_ffma += bin_dict['ffma']
-        bin_dict['total_worked'] = total_worked
-        bin_dict['total_confirmed'] = total_confirmed
-        bin_dict['total_dxcc'] = total_dxcc
-        bin_dict['total_challenge'] = total_challenge
-        bin_dict['total_vucc'] = total_vucc
-        bin_dict['total_ffma'] = total_ffma
-
-    #        print(("%s  %5d  %5d  %5d  %5d  %5d  %5d  %5d  %5d") % (qdate.strftime('%Y-%m-%d'),
-    #                                                               counts['worked'],
-    #                                                               counts['confirmed'],
-    #                                                               counts['total_worked'],
-    #                                                               counts['total_confirmed'],
-    #                                                               counts['new_dxcc'],
-    #                                                               counts['total_new_dxcc'],
-    #                                                               counts['challenge'],
-    #                                                               counts['total_challenge']))
-
     # top 20 most productive days
     if False:
         number_of_top_days = 20
-        if len(date_records) < number_of_top_days:
-            number_of_top_days = len(date_records)
+        if len(qso_dates) < number_of_top_days:
+            number_of_top_days = len(qso_dates)
         print()
         print('Top %d days' % number_of_top_days)
         print()
-        most_productive = sorted(list(date_records.values()), key=lambda counts: counts['worked'], reverse=True)
+        most_productive = np.argsort(-qso_date_counts, kind='stable')
         for i in range(0, number_of_top_days):
-            print('%2d  %12s %5d' % (i + 1, str(most_productive[i]['qdate']), most_productive[i]['worked']))
+            qdate = convert_qso_date(str(qso_dates[most_productive[i]]))
+            print('%2d  %12s %5d' % (i + 1, str(qdate), qso_date_counts[most_productive[i]]))
 
     # show top calls
     if False:
-        calls_by_qso = []
-        for call, qso_list in unique_calls.items():
-            calls_by_qso.append((call, len(qso_list)))
-        calls_by_qso = sorted(calls_by_qso, key=lambda count: count[1], reverse=True)
+        calls_by_qso = np.argsort(-call_counts, kind='stable')
 
         number_of_top_calls = 50
         print()
         print('Top %d calls' % number_of_top_calls)
         print()
         for i in range(0, number_of_top_calls):
-            print('%2d %10s %3d' % (i + 1, calls_by_qso[i][0], calls_by_qso[i][1]))
+            print('%2d %10s %3d' % (i + 1, table.calls[calls_by_qso[i]], call_counts[calls_by_qso[i]]))
 
     # dump the dxcc_counts data
     dxcc_records = dxcc_confirmed.values()
@@ -464,13 +365,7 @@ def crunch_data(qso_list):
                 rec['20M'], rec['17M'], rec['15M'], rec['12M'],
                 rec['10M'], rec['6M']))
 
-    # don't want to sort this more than once.
-    # the result is a list of counts dicts
-    results = []
-    for key in sorted(date_records.keys()):
-        # if key >= start_date and key <= end_date:
-        results.append(date_records[key])
-    logging.debug('crunched data for %d log days' % len(results))
+    logging.debug('crunched data for %d log days' % len(qso_dates))
     return bin_data
 
 
@@ -547,6 +442,12 @@ def main():
     parser.add_argument('--marathon-year', type=str, help='create DX marathon charts for year')
     parser.add_argument('--callsign', type=str, help='Callsign to chart for')
     parser.add_argument('--filename', type=str, help='name of ADIF file')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes to parse the ADIF file with')
+    parser.add_argument('--compact', action='store_true', help='use less memory to hold the QSOs')
+    parser.add_argument('--cache', dest='cache', action='store_true', default=True,
+                        help='keep parsed ADIF files in cache files next to them, the default')
+    parser.add_argument('--no-cache', dest='cache', action='store_false', help='do not use or write cache files')
+    parser.add_argument('--store', type=str, help='SQLite QSO store to merge the ADIF file into and read QSOs from')
     args = parser.parse_args()
 
     log_format = '%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s'
@@ -568,17 +469,27 @@ def main():
     while len(callsign) < 3:
         callsign = input('enter callsign: ')
 
-    while len(filename) < 4:
-        filename = input('Enter adif file name: ')
+    store = None
+    if args.store is not None:
+        store = adif.QsoStore(args.store)
+        logging.info(f'{len(store)} QSOs in store {args.store}')
+
+    qso_list = None
+    if store is None or args.filename is not None:
+        while len(filename) < 4:
+            filename = input('Enter adif file name: ')
 
-    filename = 'data/' + filename
-    if not os.path.exists(filename):
-        filename = ''
+        filename = 'data/' + filename
+        if not os.path.exists(filename):
+            filename = ''
 
-    adif_header, qso_list = adif.read_adif_file(filename)
-    logging.info('read {} qsls from {}'.format(len(qso_list), filename))
+        adif_header, qso_list = adif.read_adif_file(filename, workers=args.workers, compact=args.compact,
+                                                    cache=args.cache)
+        logging.info('read {} qsls from {}'.format(len(qso_list), filename))
+        if store is not None and adif_header is not None:
+            store.merge(adif_header, qso_list)
 
-    if qso_list is not None:
+    if qso_list is not None or store is not None:
         all_time_charts = False # True
         if all_time_charts:
             start_date = None
@@ -586,6 +497,8 @@ def main():
             # start_date = datetime.datetime.strptime('20070101', '%Y%m%d').date()
             # start_date = datetime.datetime.strptime('20180101', '%Y%m%d').date()
             # end_date   = datetime.datetime.strptime('20181231', '%Y%m%d').date()
+            if store is not None:
+                qso_list = list(store.qsos())
             draw_charts(qso_list, callsign, start_date=start_date, end_date=end_date)
 
         marathon_charts = args.marathon_year is not None
@@ -604,11 +517,16 @@ def main():
             callsign = callsign + f'_{year_int:04d}'
             start_date = datetime.datetime.strptime(f'{year_int:04d}0101', '%Y%m%d').date()
             end_date = datetime.datetime.strptime(f'{year_int+1:04d}0101', '%Y%m%d').date()
-            for qso in qso_list:
-                qso_date = datetime.datetime.strptime(qso['qso_date'], '%Y%m%d').date()
-                if start_date <= qso_date < end_date:
-                    marathon_qso_list.append(qso)
+            if store is not None:
+                marathon_qso_list = list(store.qsos(start_date, end_date))
+            else:
+                for qso in qso_list:
+                    qso_date = datetime.datetime.strptime(qso['qso_date'], '%Y%m%d').date()
+                    if start_date <= qso_date < end_date:
+                        marathon_qso_list.append(qso)
             draw_charts(marathon_qso_list, callsign, start_date=start_date, end_date=end_date)
+    if store is not None:
+        store.close()
     print('done.')
 
 
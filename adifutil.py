@@ -19,7 +19,8 @@ def main():
     fn = 'w1cum.adif'
     start_of_contest = datetime.datetime.strptime("20190622180000", '%Y%m%d%H%M%S')
     end_of_contest = datetime.datetime.strptime("20190623180000", '%Y%m%d%H%M%S')
-    qsos = adif.read_adif_file(fn)
+    qsos = adif.iter_adif(fn)
+    next(qsos)  # skip the header
     band_totals = {}
 
     num_qsos = 0
@@ -5,19 +5,22 @@ import argparse
 import datetime
 import logging
 import time
-from adif import read_adif_file, qso_string
+from adif import diff_qsos, iter_adif
 
 __version__ = '0.0.1'
 
+# fields compared on matching QSOs unless --fields says otherwise.  the key fields are left out,
+# and so is time_on, matched QSOs can differ in seconds or, with --tolerance, by more.
+COMPARE_FIELDS = ['mode', 'freq', 'gridsquare', 'dxcc', 'state', 'cqz', 'ituz']
+
+
 def adif_date_range(qsos, start_date, end_date):
-    narrowed_qsos = []
     for qso in qsos:
         qso_date_string = qso.get('qso_date')
         if qso_date_string is not None:
             qso_date = datetime.datetime.strptime(qso_date_string, '%Y%m%d').date()
             if start_date <= qso_date < end_date:
-                narrowed_qsos.append(qso)
-    return narrowed_qsos
+                yield qso
 
 
 def qso_key(qso):
@@ -38,6 +41,11 @@ def main():
     parser.add_argument('--end_date', help='end date')
     parser.add_argument('--debug', action='store_true', help='show logging informational output')
     parser.add_argument('--info', action='store_true', help='show informational diagnostic output')
+    parser.add_argument('--tolerance', type=int,
+                        help='match QSOs on call, band and mode with times up to TOLERANCE seconds apart')
+    parser.add_argument('--fields',
+                        help='comma separated fields to compare on matching QSOs, '
+                             f'"all" for every common field, default is {",".join(COMPARE_FIELDS)}')
     parser.add_argument('filename', nargs=2, type=str, help='name of ADIF file')
     args = parser.parse_args()
 
@@ -67,47 +75,48 @@ def main():
     left_file = args.filename[0]
     right_file = args.filename[1]
 
-    # read the two adif files
-    header1, left_qsos = read_adif_file(left_file)
-    logging.info(f'{len(left_qsos)} qsos read from {left_file}')
-    header2, right_qsos = read_adif_file(right_file)
-    logging.info(f'{len(right_qsos)} qsos read from {right_file}')
-
-    # narrow to date range
-    if start_date is not None and end_date is not None:
-        left_qsos = adif_date_range(left_qsos, start_date, end_date)
-        logging.info(f'{len(left_qsos)} qsos narrowed from {left_file}')
-        right_qsos = adif_date_range(right_qsos, start_date, end_date)
-        logging.info(f'{len(right_qsos)} qsos narrowed from {right_file}')
-
-    # build keys
-    left_keys = []
-    for qso in left_qsos:
-        left_keys.append(qso_key(qso))
-    right_keys = []
-    for qso in right_qsos:
-        right_keys.append(qso_key(qso))
-
-    # now start comparing.
-    # first make sure that every key in list 1 is in list 2.
+    # read the two adif files.
+    qso_lists = []
+    for filename in (left_file, right_file):
+        qsos = iter_adif(filename)
+        next(qsos)  # skip the header
+        # narrow to date range
+        if start_date is not None and end_date is not None:
+            qsos = adif_date_range(qsos, start_date, end_date)
+        qsos = list(qsos)
+        logging.info(f'{len(qsos)} qsos read from {filename}')
+        qso_lists.append(qsos)
+
+    if args.fields is None:
+        fields = COMPARE_FIELDS
+    elif args.fields == 'all':
+        fields = None
+    else:
+        fields = args.fields.split(',')
+    left_only, right_only, different = diff_qsos(qso_lists[0], qso_lists[1], key=qso_key, fields=fields,
+                                                tolerance=args.tolerance)
+
+    # first show every QSO in list 1 that is not in list 2.
     print(f'looking for QSOs in {left_file} that are not in {right_file}')
-    left_missing = 0
-    for qk in left_keys:
-        if qk not in right_keys:
-            left_missing += 1
-            print(f'did not find qso {qk} in {right_file}')
+    for qso in left_only:
+        print(f'did not find qso {qso_key(qso)} in {right_file}')
 
     print()
-    # next make sure that every key in list 1 is in list 2.
+    # next show every QSO in list 2 that is not in list 1.
     print(f'looking for QSOs in {right_file} that are not in {left_file}')
-    right_missing = 0
-    for qk in right_keys:
-        if qk not in left_keys:
-            right_missing += 1
-            print(f'did not find qso {qk} in {left_file}')
-
-    print(f'{left_missing} qsos not found in {right_file}')
-    print(f'{right_missing} qsos not found in {left_file}')
+    for qso in right_only:
+        print(f'did not find qso {qso_key(qso)} in {left_file}')
+
+    print()
+    print('looking for QSOs in both files with different data')
+    for left_qso, right_qso, different_fields in different:
+        for field in different_fields:
+            print(f'qso {qso_key(left_qso)} {field}: {left_qso.get(field)} in {left_file}, '
+                  f'{right_qso.get(field)} in {right_file}')
+
+    print(f'{len(left_only)} qsos not found in {right_file}')
+    print(f'{len(right_only)} qsos not found in {left_file}')
+    print(f'{len(different)} qsos have different data')
 
     print('done')
 
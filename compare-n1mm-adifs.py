@@ -7,19 +7,17 @@ import argparse
 import datetime
 import logging
 import time
-from adif import read_adif_file, qso_string
+from adif import AdifTail, qso_presence, qso_string, refresh_adif_tails
 
 __version__ = '0.0.1'
 
 def adif_date_range(qsos, start_date, end_date):
-    narrowed_qsos = []
     for qso in qsos:
         qso_date_string = qso.get('qso_date')
         if qso_date_string is not None:
             qso_date = datetime.datetime.strptime(qso_date_string, '%Y%m%d').date()
             if start_date <= qso_date < end_date:
-                narrowed_qsos.append(qso)
-    return narrowed_qsos
+                yield qso
 
 
 def qso_key(qso):
@@ -37,6 +35,31 @@ def n1mm_qso_key(qso):
     return n1mm_id
 
 
+def compare_logs(tails, start_date, end_date):
+    qso_lists = []
+    for tail in tails:
+        qsos = tail.qsos
+        if start_date is not None and end_date is not None:
+            qsos = list(adif_date_range(qsos, start_date, end_date))
+        logging.info(f'{len(qsos)} qsos in {tail.adif_file_name}')
+        qso_lists.append(qsos)
+
+    presence = qso_presence(qso_lists, n1mm_qso_key)
+    all_logs = (1 << len(tails)) - 1
+    missing_counts = [0] * len(tails)
+    for bitmap, qso in presence.values():
+        if bitmap != all_logs:
+            missing_from = []
+            for i, tail in enumerate(tails):
+                if not bitmap & (1 << i):
+                    missing_from.append(tail.adif_file_name)
+                    missing_counts[i] += 1
+            logging.info(f'QSO {qso_string(qso)} is not in {", ".join(missing_from)}')
+    for tail, missing_count in zip(tails, missing_counts):
+        logging.info(f'{missing_count} QSOs are missing from {tail.adif_file_name}')
+    logging.info(f'{len(presence)} QSOs in all logs')
+
+
 def main():
 
     parser = argparse.ArgumentParser(description='Compare ADIF files')
@@ -44,6 +67,8 @@ def main():
     parser.add_argument('--end_date', help='end date')
     parser.add_argument('--debug', action='store_true', help='show logging informational output')
     parser.add_argument('--info', action='store_true', help='show informational diagnostic output')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes to read the files with')
+    parser.add_argument('--follow', type=float, help='compare again every FOLLOW seconds, reading only new QSOs')
     parser.add_argument('filename', nargs='*', type=str, help='names of ADIF files')
     args = parser.parse_args()
 
@@ -70,33 +95,14 @@ def main():
         logging.error('wrong number of files, must be at least two')
         exit(1)
 
-    qsos_dict = {}
-    first = True
-
-    for filename in args.filename:
-        header, qsos = read_adif_file(filename)
-        if start_date is not None and end_date is not None:
-            qsos = adif_date_range(qsos, start_date, end_date)
-            logging.info(f'{len(qsos)} qsos narrowed from {filename}')
-
-        file_qsos_dict = {}
-        for qso in qsos:
-            key = n1mm_qso_key(qso)
-            file_qsos_dict[key] = qso
-            if first:
-                qsos_dict[key] = qso
-            else:
-                if qsos_dict.get(key) is None:
-                    logging.info(f'QSO {qso_string(qso)} was not seen in any previous log.')
-                    qsos_dict[key] = qso
-        if not first:
-            qsos_keys = list(qsos_dict.keys())
-            for key in qsos_keys:
-                if file_qsos_dict.get(key) is None:
-                    logging.info(f'QSO {qso_string(qsos_dict.get(key))} was seen in a previous log, but is not in this file.')
-
-        first = False
-        logging.info(f'{len(qsos_dict)} QSOs so far...')
+    tails = [AdifTail(filename) for filename in args.filename]
+    while True:
+        for tail, new_qsos in zip(tails, refresh_adif_tails(tails, args.workers)):
+            logging.info(f'{len(new_qsos)} new qsos read from {tail.adif_file_name}')
+        compare_logs(tails, start_date, end_date)
+        if args.follow is None:
+            break
+        time.sleep(args.follow)
     print('done')
 
 
@@ -20,6 +20,9 @@ import time
 import adif
 import adif_log_analyzer
 
+# downloads are saved under this suffix, and renamed when they are complete.
+DOWNLOAD_SUFFIX = '.download'
+
 
 def get_file_date_size(filename):
     if os.path.exists(filename):
@@ -39,7 +42,7 @@ def show_file_info(filename):
 
 
 def menu():
-    valid_choices = '0123456'
+    valid_choices = '01234567'
     while True:
         print('1. Download complete LoTW ADIF')
         print('2. Download updates to existing LoTW ADIF')
@@ -47,6 +50,7 @@ def menu():
         print('4. Save current LoTW ADIF')
         print('5. Merge LoTW and DXCC QSLs into combined ADIF')
         print('6. Draw the charts from this data')
+        print('7. Download new QSOs, new QSLs and DXCC QSL cards at the same time')
         print('0. Exit this program')
         print()
         choice = input('Your Choice? ')
@@ -71,6 +75,17 @@ def main():
     parser.add_argument('--login-callsign', type=str, help='Callsign to use to log in to LoTW')
     parser.add_argument('--password', type=str, help='Password to use to log into to LoTW')
     parser.add_argument('--callsign', type=str, help='Callsign to analyze records for')
+    parser.add_argument('--compact', action='store_true', help='use less memory to hold the QSOs')
+    parser.add_argument('--cache', dest='cache', action='store_true', default=True,
+                        help='keep parsed ADIF files in cache files next to them, the default')
+    parser.add_argument('--no-cache', dest='cache', action='store_false', help='do not use or write cache files')
+    parser.add_argument('--timeout', type=float, default=60, help='LoTW network timeout in seconds')
+    parser.add_argument('--retries', type=int, default=3, help='number of times to retry failed LoTW requests')
+    parser.add_argument('--windows', type=int, default=1,
+                        help='split a complete download into this many QSO date windows fetched in parallel')
+    parser.add_argument('--workers', type=int, default=4, help='number of date windows to fetch at the same time')
+    parser.add_argument('--asyncio', action='store_true',
+                        help='make the downloads of choice 7 under one asyncio event loop, they are not retried')
     args = parser.parse_args()
 
     log_format = '%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s'
@@ -123,7 +138,7 @@ def main():
     dxcc_qsls_file_name = '{}{}-cards.adif'.format(data_dir, filename_callsign)
 
     if os.path.exists(lotw_adif_file_name):
-        lotw_header, lotw_qsos = adif.read_adif_file(lotw_adif_file_name)
+        lotw_header, lotw_qsos = adif.read_adif_file(lotw_adif_file_name, compact=args.compact, cache=args.cache)
         if lotw_header.get('app_lotw_lastqsl') is None:
             lotw_header['app_lotw_lastqsl'] = lotw_header.get('app_lotw_lastqsorx')
     else:
@@ -131,13 +146,14 @@ def main():
         lotw_qsos = None
 
     if os.path.exists(dxcc_qsls_file_name):
-        dxcc_qsls_header, dxcc_qsl_cards = adif.read_adif_file(dxcc_qsls_file_name)
+        dxcc_qsls_header, dxcc_qsl_cards = adif.read_adif_file(dxcc_qsls_file_name, cache=args.cache)
     else:
         dxcc_qsls_header = None
         dxcc_qsl_cards = None
 
     last_qso_date = None
     last_qsl_date = None
+    lotw_client = adif.LotwClient(timeout=args.timeout, retries=args.retries)
 
     while True:
         print('---------------------------------------')
@@ -161,10 +177,15 @@ def main():
         print('---------------------------------------')
         choice = menu()
         if choice == '0':
+            lotw_client.close()
             exit()
         elif choice == '1':
             password = get_password(password)
-            lotw_header, lotw_qsos = adif.get_lotw_adif(login_callsign, password, callsign, filename=lotw_adif_file_name)
+            date_windows = adif.lotw_date_windows(args.windows) if args.windows > 1 else None
+            lotw_header, lotw_qsos = adif.get_lotw_adif(login_callsign, password, callsign,
+                                                        filename=lotw_adif_file_name,
+                                                        client=lotw_client, date_windows=date_windows,
+                                                        workers=args.workers)
         elif choice == '2':
             if last_qso_date is None:
                 print('Cannot update, no base, download first.')
@@ -176,25 +197,31 @@ def main():
                                                                              password,
                                                                              callsign,
                                                                              filename=lotw_adif_new_qsos_file_name,
-                                                                             qso_qsorxsince=last_qso_date)
+                                                                             qso_qsorxsince=last_qso_date,
+                                                                             client=lotw_client)
                     new_last_qso_date = lotw_header.get('app_lotw_lastqsorx')
                     logging.info(
                         'New last QSO Received {}, {} QSO records'.format(new_last_qso_date, len(new_lotw_qsos)))
-                    lotw_header, lotw_qsos = adif.merge(lotw_header, lotw_qsos, new_lotw_qsos)
+                    lotw_qso_dict = adif.qso_index(lotw_qsos)
+                    lotw_header, lotw_qsos = adif.merge(lotw_header, lotw_qsos, new_lotw_qsos, lotw_qso_dict)
                     if new_lotw_qsos_header.get('app_lotw_lastqsorx') is not None:
                         lotw_header['app_lotw_lastqsorx'] = new_lotw_qsos_header.get('app_lotw_lastqsorx')
 
                     logging.info(f'fetching new QSLs since {last_qsl_date}')
-                    new_lotw_qsls_header, new_lotw_qsls = adif.call_lotw(login=login_callsign,
-                                                                         password=password,
-                                                                         filename=lotw_adif_new_qsls_file_name,
-                                                                         qso_owncall=callsign,
-                                                                         qso_qsl='yes',
-                                                                         qso_qsldetail='yes',
-                                                                         qso_qslsince=last_qsl_date,
-                                                                         qso_query='1'
-                                                                         )
-                    lotw_header, lotw_qsos = adif.merge(lotw_header, lotw_qsos, new_lotw_qsls)
+                    new_lotw_qsls_header, new_lotw_qsls = adif.call_lotw_resumable(
+                        'qso_qslsince',
+                        'app_lotw_rxqsl',
+                        client=lotw_client,
+                        login=login_callsign,
+                        password=password,
+                        filename=lotw_adif_new_qsls_file_name,
+                        qso_owncall=callsign,
+                        qso_qsl='yes',
+                        qso_qsldetail='yes',
+                        qso_qslsince=last_qsl_date,
+                        qso_query='1'
+                    )
+                    lotw_header, lotw_qsos = adif.merge(lotw_header, lotw_qsos, new_lotw_qsls, lotw_qso_dict)
                     if new_lotw_qsls_header.get('app_lotw_lastqsl') is not None:
                         lotw_header['app_lotw_lastqsl'] = new_lotw_qsls_header.get('app_lotw_lastqsl')
                 except Exception as ex:
@@ -202,7 +229,8 @@ def main():
 
         elif choice == '3':
             password = get_password(password)
-            dxcc_qsls_header, dxcc_qsl_cards = adif.get_qsl_cards(login_callsign, password, dxcc_qsls_file_name)
+            dxcc_qsls_header, dxcc_qsl_cards = adif.get_qsl_cards(login_callsign, password, dxcc_qsls_file_name,
+                                                                  client=lotw_client)
         elif choice == '4':  # save lotw qsos data
             adif.write_adif_file(lotw_header, lotw_qsos, lotw_adif_file_name, abridge_results=False)
         elif choice == '5':
@@ -212,6 +240,87 @@ def main():
                 lotw_qsos = adif.combine_qsos(lotw_qsos, dxcc_qsl_cards)
         elif choice == '6':
             adif_log_analyzer.draw_charts(lotw_qsos, callsign)
+        elif choice == '7':
+            if last_qso_date is None:
+                print('Cannot update, no base, download first.')
+            else:
+                password = get_password(password)
+                logging.info(f'fetching new QSOs since {last_qso_date}, new QSLs since {last_qsl_date} and QSL cards')
+                try:
+                    if args.asyncio:
+                        results = adif.run_lotw_syncs([
+                            {'login': login_callsign,
+                             'password': password,
+                             'filename': lotw_adif_new_qsos_file_name + DOWNLOAD_SUFFIX,
+                             'qso_query': '1',
+                             'qso_qsl': 'no',
+                             'qso_owncall': callsign,
+                             'qso_qsldetail': 'yes',
+                             'qso_qsorxsince': last_qso_date,
+                             },
+                            {'login': login_callsign,
+                             'password': password,
+                             'filename': lotw_adif_new_qsls_file_name + DOWNLOAD_SUFFIX,
+                             'qso_owncall': callsign,
+                             'qso_qsl': 'yes',
+                             'qso_qsldetail': 'yes',
+                             'qso_qslsince': last_qsl_date,
+                             'qso_query': '1',
+                             },
+                            {'url': adif.LOTW_QSL_CARDS_URL,
+                             'login': login_callsign,
+                             'password': password,
+                             'filename': dxcc_qsls_file_name + DOWNLOAD_SUFFIX,
+                             'ac_acct': '1',
+                             },
+                        ], timeout=args.timeout)
+                        # add 'qsl_rcvd'='y' to be consistent with LoTW, as get_qsl_cards does.
+                        for qsl_card in results[2][1] or []:
+                            qsl_card['qsl_rcvd'] = 'y'
+                    else:
+                        results = adif.call_lotw_concurrently([
+                            (adif.get_lotw_adif, {'username': login_callsign,
+                                                  'password': password,
+                                                  'callsign': callsign,
+                                                  'filename': lotw_adif_new_qsos_file_name + DOWNLOAD_SUFFIX,
+                                                  'qso_qsorxsince': last_qso_date,
+                                                  }),
+                            (adif.call_lotw_resumable, {'since_param': 'qso_qslsince',
+                                                        'watermark_field': 'app_lotw_rxqsl',
+                                                        'login': login_callsign,
+                                                        'password': password,
+                                                        'filename': lotw_adif_new_qsls_file_name + DOWNLOAD_SUFFIX,
+                                                        'qso_owncall': callsign,
+                                                        'qso_qsl': 'yes',
+                                                        'qso_qsldetail': 'yes',
+                                                        'qso_qslsince': last_qsl_date,
+                                                        'qso_query': '1',
+                                                        }),
+                            (adif.get_qsl_cards, {'username': login_callsign,
+                                                  'password': password,
+                                                  'filename': dxcc_qsls_file_name + DOWNLOAD_SUFFIX,
+                                                  }),
+                        ], timeout=args.timeout, retries=args.retries)
+                    (new_lotw_qsos_header, new_lotw_qsos), (new_lotw_qsls_header, new_lotw_qsls), \
+                        (new_dxcc_qsls_header, new_dxcc_qsl_cards) = results
+                    if new_lotw_qsos_header is None or new_lotw_qsls_header is None or new_dxcc_qsls_header is None:
+                        print('Download failed, nothing was changed.')
+                    else:
+                        # the downloads all worked, now the saved files can be replaced.
+                        for file_name in (lotw_adif_new_qsos_file_name, lotw_adif_new_qsls_file_name,
+                                          dxcc_qsls_file_name):
+                            os.replace(file_name + DOWNLOAD_SUFFIX, file_name)
+                        # merge in the same order as the one at a time update does.
+                        lotw_qso_dict = adif.qso_index(lotw_qsos)
+                        lotw_header, lotw_qsos = adif.merge(lotw_header, lotw_qsos, new_lotw_qsos, lotw_qso_dict)
+                        if new_lotw_qsos_header.get('app_lotw_lastqsorx') is not None:
+                            lotw_header['app_lotw_lastqsorx'] = new_lotw_qsos_header.get('app_lotw_lastqsorx')
+                        lotw_header, lotw_qsos = adif.merge(lotw_header, lotw_qsos, new_lotw_qsls, lotw_qso_dict)
+                        if new_lotw_qsls_header.get('app_lotw_lastqsl') is not None:
+                            lotw_header['app_lotw_lastqsl'] = new_lotw_qsls_header.get('app_lotw_lastqsl')
+                        dxcc_qsls_header, dxcc_qsl_cards = new_dxcc_qsls_header, new_dxcc_qsl_cards
+                except Exception as ex:
+                    print(ex)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,252 @@
+"""
+lotw-benchmark.py -- time the LoTW download paths against the local stand-in server.
+
+the stand-in runs in its own process, so that serving does not compete with
+parsing for the GIL.  each scenario is run --repeat times and the best run is reported.
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+
+import adif
+import lotw_standin
+
+__version__ = '0.0.1'
+
+USERNAME = 'benchmark'
+PASSWORD = 'benchmark'
+CALLSIGN = 'N1KDO'
+
+
+def start_standin(args):
+    """
+    start lotw_standin.py in a new process.
+    :return: the process, and the base url of the server.
+    """
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lotw_standin.py'),
+               '--qsos', str(args.qsos),
+               '--seed', str(args.seed),
+               '--callsign', CALLSIGN,
+               '--latency', str(args.latency),
+               '--bandwidth', str(args.bandwidth),
+               '--chunk-size', str(args.chunk_size),
+               '--fail-rate', str(args.fail_rate),
+               '--truncate-rate', str(args.truncate_rate),
+               ]
+    if args.chunked:
+        command.append('--chunked')
+    if args.no_gzip:
+        command.append('--no-gzip')
+    if args.shuffle:
+        command.append('--shuffle')
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, universal_newlines=True)
+    line = process.stdout.readline().strip()
+    if ' at http://' not in line:
+        process.kill()
+        raise Exception(f'stand-in server did not start: {line}')
+    return process, line.split(' at ')[-1]
+
+
+def server_stats(base_url):
+    with urllib.request.urlopen(base_url + '/stats') as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def run_scenario(name, function, base_url, repeat, memory):
+    """
+    run one scenario repeat times.
+    :param function: callable that does the downloads and returns the number of QSOs it got.
+    :return: dict of the results of the fastest run, or of the first run that failed.
+    """
+    best = None
+    for _ in range(repeat):
+        before = server_stats(base_url)
+        if memory:
+            tracemalloc.start()
+        t0 = time.perf_counter()
+        error = None
+        qso_count = 0
+        try:
+            qso_count = function()
+        except Exception as ex:
+            error = ex
+            logging.error(f'{name} failed: {ex!r}')
+        elapsed = time.perf_counter() - t0
+        peak = None
+        if memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        after = server_stats(base_url)
+        result = {key: after[key] - before[key] for key in after}
+        result.update({'name': name, 'seconds': elapsed, 'qsos': qso_count, 'peak': peak, 'error': error})
+        if error is not None:
+            return result
+        logging.info(f'{name}: {qso_count} QSOs in {elapsed:.3f} sec')
+        if best is None or elapsed < best['seconds']:
+            best = result
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark LoTW downloads against a local stand-in server')
+    parser.add_argument('--debug', action='store_true', help='show logging informational output')
+    parser.add_argument('--info', action='store_true', help='show informational diagnostic output')
+    parser.add_argument('--qsos', type=int, default=50000, help='number of QSOs in the stand-in log')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for the log and failures')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the server waits before each response')
+    parser.add_argument('--bandwidth', type=int, default=0, help='bytes per second the server sends, 0 for no limit')
+    parser.add_argument('--chunk-size', type=int, default=65536, help='bytes the server writes at a time')
+    parser.add_argument('--chunked', action='store_true', help='server uses chunked transfer encoding')
+    parser.add_argument('--no-gzip', action='store_true', help='server never gzips responses')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of requests that get a 503')
+    parser.add_argument('--truncate-rate', type=float, default=0.0, help='fraction of responses cut off early')
+    parser.add_argument('--shuffle', action='store_true', help='server sends reports out of watermark order')
+    parser.add_argument('--windows', type=int, default=8, help='number of date windows for the windowed download')
+    parser.add_argument('--workers', type=int, default=4, help='number of windows to download at a time')
+    parser.add_argument('--retries', type=int, default=3, help='number of times to retry a failed request')
+    parser.add_argument('--repeat', type=int, default=3, help='number of times to run each scenario')
+    parser.add_argument('--memory', action='store_true', help='measure peak memory, slows everything down')
+    args = parser.parse_args()
+
+    log_format = '%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s'
+    log_date_format = '%Y-%m-%d %H:%M:%S'
+    if args.debug:
+        logging.basicConfig(format=log_format, datefmt=log_date_format, level=logging.DEBUG)
+    elif args.info:
+        logging.basicConfig(format=log_format, datefmt=log_date_format, level=logging.INFO)
+    else:
+        logging.basicConfig(format=log_format, datefmt=log_date_format, level=logging.WARNING)
+
+    logging.Formatter.converter = time.gmtime
+
+    process, base_url = start_standin(args)
+    report_url = base_url + lotw_standin.REPORT_PATH
+    qsl_cards_url = base_url + lotw_standin.QSL_CARDS_PATH
+    windows = adif.lotw_date_windows(args.windows, '2005-01-01', '2024-12-31')
+    work_dir = tempfile.mkdtemp(prefix='lotw-benchmark-')
+    adif_file_name = os.path.join(work_dir, 'lotw.adif')
+
+    def new_client():
+        return adif.LotwClient(retries=args.retries, backoff=0.1)
+
+    def full_download():
+        # a failed download is resumed from its checkpoint, the way running get_lotw_adif.py again would.
+        with new_client() as client:
+            for attempt in range(args.retries + 1):
+                try:
+                    _, qsos = adif.get_lotw_adif(USERNAME, PASSWORD, CALLSIGN, filename=adif_file_name,
+                                                 client=client, url=report_url)
+                    return len(qsos)
+                except (OSError, http.client.HTTPException) as ex:
+                    if attempt == args.retries:
+                        raise
+                    logging.warning(f'download failed: {ex!r}, resuming')
+                    client.close()
+
+    def windowed_download():
+        # the windows that finished are kept in their checkpoints when another one fails.
+        with new_client() as client:
+            for attempt in range(args.retries + 1):
+                try:
+                    _, qsos = adif.get_lotw_adif(USERNAME, PASSWORD, CALLSIGN, filename=adif_file_name,
+                                                 client=client, date_windows=windows, workers=args.workers,
+                                                 url=report_url)
+                    return len(qsos)
+                except Exception as ex:
+                    if attempt == args.retries:
+                        raise
+                    logging.warning(f'download failed: {ex!r}, resuming')
+
+    def qsl_cards():
+        with new_client() as client:
+            _, cards = adif.get_qsl_cards(USERNAME, PASSWORD, client=client, url=qsl_cards_url)
+        return len(cards)
+
+    def update():
+        # fetch the QSOs and QSLs received in the last year, and merge them into the log.
+        header, qsos = adif.read_adif_file(adif_file_name)
+        with new_client() as client:
+            _, new_qsos = adif.call_lotw_retrying(client=client,
+                                                  url=report_url,
+                                                  login=USERNAME,
+                                                  password=PASSWORD,
+                                                  qso_query='1',
+                                                  qso_qsl='no',
+                                                  qso_owncall=CALLSIGN,
+                                                  qso_qsldetail='yes',
+                                                  qso_qsorxsince='2024-01-01',
+                                                  )
+            _, new_qsls = adif.call_lotw_retrying(client=client,
+                                                  url=report_url,
+                                                  login=USERNAME,
+                                                  password=PASSWORD,
+                                                  qso_query='1',
+                                                  qso_qsl='yes',
+                                                  qso_owncall=CALLSIGN,
+                                                  qso_qsldetail='yes',
+                                                  qso_qslsince='2024-01-01',
+                                                  )
+        qso_dict = adif.qso_index(qsos)
+        header, qsos = adif.merge(header, qsos, new_qsos, qso_dict)
+        header, qsos = adif.merge(header, qsos, new_qsls, qso_dict)
+        return len(new_qsos) + len(new_qsls)
+
+    def async_download():
+        merger = adif.QsoMerger({}, [])
+        _, qsos = asyncio.run(adif.call_lotw_async(consumer=merger,
+                                                   url=report_url,
+                                                   login=USERNAME,
+                                                   password=PASSWORD,
+                                                   qso_query='1',
+                                                   qso_qsl='no',
+                                                   qso_owncall=CALLSIGN,
+                                                   qso_qsldetail='yes',
+                                                   qso_qsorxsince='1900-01-01',
+                                                   ))
+        merger.finish()
+        return len(qsos)
+
+    scenarios = [('full download', full_download),
+                 (f'{len(windows)} date windows', windowed_download),
+                 ('QSL cards', qsl_cards),
+                 ('update', update),
+                 ]
+    if args.fail_rate == 0 and args.truncate_rate == 0:
+        # call_lotw_async does not retry.
+        scenarios.append(('asyncio download', async_download))
+
+    results = []
+    try:
+        for name, function in scenarios:
+            results.append(run_scenario(name, function, base_url, args.repeat, args.memory))
+    finally:
+        process.terminate()
+        process.wait()
+        for file_name in os.listdir(work_dir):
+            os.remove(os.path.join(work_dir, file_name))
+        os.rmdir(work_dir)
+
+    print(f'{"scenario":<20} {"seconds":>8} {"QSOs":>8} {"QSOs/s":>9} {"MB/s":>7} {"requests":>8} '
+          f'{"503s":>5} {"cut":>4} {"peak MB":>8}')
+    for result in results:
+        seconds = result['seconds']
+        if result['error'] is not None:
+            print(f'{result["name"]:<20} {seconds:8.3f} failed: {result["error"]!r}')
+            continue
+        peak = f'{result["peak"] / 1048576:.1f}' if result['peak'] is not None else '-'
+        print(f'{result["name"]:<20} {seconds:8.3f} {result["qsos"]:8d} {result["qsos"] / seconds:9.0f} '
+              f'{result["bytes_sent"] / 1048576 / seconds:7.2f} {result["requests"]:8d} '
+              f'{result["failed"]:5d} {result["truncated"]:4d} {peak:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+"""
+lotw_standin.py -- local stand-in for the LoTW lotwreport.adi and qslcards.php services.
+
+it serves synthetic adif, so the LoTW download code can be tested and benchmarked
+without calling lotw.arrl.org.  the log is made from a seeded random generator,
+so the same size and seed always give the same QSOs.
+
+the query parameters that LoTW uses to select QSOs are honored:
+  qso_qsl, qso_qsorxsince, qso_qslsince, qso_startdate, qso_enddate and qso_owncall.
+knobs for latency, bandwidth, write size, chunked transfer encoding, gzip, and
+failed or truncated responses make it possible to test slow and broken networks.
+
+/stats returns the request counters as JSON.
+"""
+import argparse
+import datetime
+import gzip
+import http.server
+import json
+import logging
+import random
+import threading
+import time
+import urllib.parse
+
+import adif
+
+__version__ = '0.0.1'
+
+REPORT_PATH = '/lotwuser/lotwreport.adi'
+QSL_CARDS_PATH = '/lotwuser/logbook/qslcards.php'
+
+BANDS = [('160M', '1.83000'), ('80M', '3.57300'), ('40M', '7.07400'), ('30M', '10.13600'), ('20M', '14.07400'),
+         ('17M', '18.10000'), ('15M', '21.07400'), ('12M', '24.91500'), ('10M', '28.07400'), ('6M', '50.31300')]
+MODES = [('CW', 'CW'), ('SSB', 'PHONE'), ('FT8', 'DATA'), ('FT4', 'DATA'), ('RTTY', 'DATA')]
+
+
+def adif_text(name, value):
+    """
+    :return: an adif field, with the name upper case except for the LoTW prefix, as LoTW sends it.
+    """
+    name = name.upper().replace('APP_LOTW_', 'APP_LoTW_')
+    return f'<{name}:{len(value)}>{value}\n'
+
+
+class StandInLog:
+    """
+    the synthetic QSOs of one LoTW account, kept in the order LoTW received them.
+    about 40% of the QSOs are confirmed, and every tenth confirmed QSO also has a DXCC QSL card.
+    reports are sent in watermark order, unless shuffle is set, then they are sent in a random order.
+    """
+
+    def __init__(self, qso_count, seed=1, callsign='N1KDO', first_date='2005-01-01', last_date='2024-12-31',
+                 shuffle=False):
+        rng = random.Random(seed)
+        first = datetime.datetime.fromisoformat(first_date)
+        span = int((datetime.datetime.fromisoformat(last_date) - first).total_seconds())
+        countries = [(dxcc, name.upper()) for dxcc, (name, deleted) in adif.dxcc_countries.items()
+                     if not deleted and dxcc != '0']
+        calls = ['{}{}{}{}'.format(rng.choice('AKNW'), rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ'), rng.randint(0, 9),
+                                   ''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(rng.randint(1, 3))))
+                 for _ in range(max(qso_count // 10, 1))]
+        qsos = []
+        for _ in range(qso_count):
+            qso_time = first + datetime.timedelta(seconds=rng.randrange(span))
+            rx_time = qso_time + datetime.timedelta(seconds=rng.randrange(30 * 86400))
+            band, freq = rng.choice(BANDS)
+            mode, mode_group = rng.choice(MODES)
+            dxcc, country = rng.choice(countries)
+            qso = {'call': rng.choice(calls),
+                   'band': band,
+                   'freq': freq,
+                   'mode': mode,
+                   'app_lotw_modegroup': mode_group,
+                   'qso_date': qso_time.strftime('%Y%m%d'),
+                   'time_on': qso_time.strftime('%H%M%S'),
+                   'app_lotw_qso_timestamp': qso_time.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                   'app_lotw_rxqso': rx_time.strftime('%Y-%m-%d %H:%M:%S'),
+                   'dxcc': dxcc,
+                   'country': country,
+                   'gridsquare': '{}{}{}{}'.format(rng.choice('ABCDEFGHIJKLMNOPQR'), rng.choice('ABCDEFGHIJKLMNOPQR'),
+                                                   rng.randint(0, 9), rng.randint(0, 9)),
+                   'station_callsign': callsign,
+                   'app_lotw_owncall': callsign,
+                   }
+            if rng.random() < 0.4:
+                qsl_time = rx_time + datetime.timedelta(seconds=rng.randrange(365 * 86400))
+                qso['qsl_rcvd'] = 'Y'
+                qso['qslrdate'] = qsl_time.strftime('%Y%m%d')
+                qso['app_lotw_rxqsl'] = qsl_time.strftime('%Y-%m-%d %H:%M:%S')
+            else:
+                qso['qsl_rcvd'] = 'N'
+            qsos.append(qso)
+        qsos.sort(key=lambda q: q['app_lotw_rxqso'])
+        self.callsign = callsign
+        self.seed = seed
+        self.shuffle = shuffle
+        self.qsos = qsos
+        self.records = [(''.join(adif_text(k, v) for k, v in qso.items()) + '<eor>\n\n').encode('iso-8859-1')
+                        for qso in qsos]
+        confirmed = [qso for qso in qsos if qso['qsl_rcvd'] == 'Y']
+        self.cards = []
+        for qso in confirmed[::10]:
+            card = {key: qso[key] for key in ('call', 'band', 'mode', 'app_lotw_modegroup', 'qso_date', 'dxcc',
+                                              'country')}
+            card['qslrdate'] = qso['qslrdate']
+            self.cards.append(card)
+        self.card_records = [(''.join(adif_text(k, v) for k, v in card.items()) + '<eor>\n\n').encode('iso-8859-1')
+                             for card in self.cards]
+
+    def report(self, query):
+        """
+        :param query: dict of the LoTW query parameters
+        :return: the lotwreport.adi response body for the query
+        """
+        qsl_only = query.get('qso_qsl', 'yes').lower() == 'yes'
+        if qsl_only:
+            since = query.get('qso_qslsince', '1900-01-01')
+            watermark_field = 'app_lotw_rxqsl'
+        else:
+            since = query.get('qso_qsorxsince', '1900-01-01')
+            watermark_field = 'app_lotw_rxqso'
+        start_date = query.get('qso_startdate', '1900-01-01').replace('-', '')
+        end_date = query.get('qso_enddate', '9999-12-31').replace('-', '')
+        owncall = query.get('qso_owncall', self.callsign).upper()
+
+        selected = []
+        for qso, record in zip(self.qsos, self.records):
+            watermark = qso.get(watermark_field)
+            if watermark is not None and watermark >= since and start_date <= qso['qso_date'] <= end_date \
+                    and qso['station_callsign'] == owncall:
+                selected.append((watermark, record))
+        selected.sort(key=lambda item: item[0])
+        last = selected[-1][0] if len(selected) > 0 else since
+        if self.shuffle:
+            random.Random(self.seed).shuffle(selected)
+
+        header = 'ARRL Logbook of the World Status Report\n'
+        generated = datetime.datetime.now(datetime.timezone.utc)
+        header += f'Generated at {generated:%Y-%m-%d %H:%M:%S} for {self.callsign}\n'
+        header += f'Query:\n    OWNCALL: {owncall}\n\n'
+        header += adif_text('programid', 'LoTW')
+        header += adif_text('app_lotw_lastqsl' if qsl_only else 'app_lotw_lastqsorx', last)
+        header += adif_text('app_lotw_numrec', str(len(selected)))
+        header += '\n<eoh>\n\n'
+        return header.encode('iso-8859-1') + b''.join(record for _, record in selected)
+
+    def qsl_cards(self):
+        """
+        :return: the qslcards.php response body
+        """
+        header = 'ARRL Logbook of the World DXCC QSL Card Report\n\n'
+        header += adif_text('programid', 'LoTW')
+        header += adif_text('app_lotw_dxccrecord_updated', '2024-12-31 00:00:00')
+        header += adif_text('app_lotw_numrec', str(len(self.cards)))
+        header += '\n<eoh>\n\n'
+        return header.encode('iso-8859-1') + b''.join(self.card_records)
+
+
+class StandInServer(http.server.ThreadingHTTPServer):
+    """
+    http server for a StandInLog.
+    :param latency: seconds to wait before answering each request.
+    :param bandwidth: bytes per second to send at, 0 for no limit.
+    :param chunk_size: number of bytes written at a time.
+    :param chunked: send with chunked transfer encoding instead of Content-Length.
+    :param use_gzip: gzip the body when the client asks for it.
+    :param fail_rate: fraction of requests answered with 503 Service Unavailable.
+    :param truncate_rate: fraction of responses that are cut off part way through.
+    :param seed: seed for choosing the failed and truncated requests.
+    """
+    daemon_threads = True
+
+    def __init__(self, log, port=0, latency=0.0, bandwidth=0, chunk_size=65536, chunked=False, use_gzip=True,
+                 fail_rate=0.0, truncate_rate=0.0, seed=1):
+        super().__init__(('127.0.0.1', port), StandInHandler)
+        self.log = log
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.chunk_size = chunk_size
+        self.chunked = chunked
+        self.use_gzip = use_gzip
+        self.fail_rate = fail_rate
+        self.truncate_rate = truncate_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'failed': 0, 'truncated': 0, 'bytes_sent': 0}
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.stats[name] += value
+
+    def choose(self, rate):
+        with self.lock:
+            return self.rng.random() < rate
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def do_GET(self):
+        server = self.server
+        parts = urllib.parse.urlsplit(self.path)
+        query = {key: values[-1] for key, values in urllib.parse.parse_qs(parts.query).items()}
+        if parts.path == '/stats':
+            with server.lock:
+                stats = dict(server.stats)
+            self.send_body(json.dumps(stats).encode('utf-8'), 'application/json', compress=False)
+            return
+
+        server.count('requests')
+        if server.latency > 0:
+            time.sleep(server.latency)
+        if server.choose(server.fail_rate):
+            server.count('failed')
+            self.send_body(b'busy, try again later\n', 'text/plain', status=503, compress=False)
+            return
+        if parts.path not in (REPORT_PATH, QSL_CARDS_PATH):
+            self.send_body(b'not found\n', 'text/plain', status=404, compress=False)
+            return
+        if not query.get('login') or not query.get('password'):
+            self.send_body(b'<html><body>Username/password incorrect</body></html>\n', 'text/html')
+            return
+        if parts.path == REPORT_PATH:
+            body = server.log.report(query)
+        else:
+            body = server.log.qsl_cards()
+        self.send_body(body, 'application/x-arrl-adif')
+
+    def send_body(self, body, content_type, status=200, compress=True):
+        server = self.server
+        accept_encoding = self.headers.get('Accept-Encoding') or ''
+        gzipped = compress and server.use_gzip and 'gzip' in accept_encoding.lower()
+        if gzipped:
+            body = gzip.compress(body, compresslevel=1)
+        truncate_at = None
+        if compress and server.choose(server.truncate_rate):
+            truncate_at = len(body) // 2
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        if server.chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        sent = 0
+        end = len(body) if truncate_at is None else truncate_at
+        start_time = time.time()
+        while sent < end:
+            piece = body[sent:min(sent + server.chunk_size, end)]
+            if server.chunked:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(piece), piece))
+            else:
+                self.wfile.write(piece)
+            self.wfile.flush()
+            sent += len(piece)
+            server.count('bytes_sent', len(piece))
+            if server.bandwidth > 0:
+                ahead = sent / server.bandwidth - (time.time() - start_time)
+                if ahead > 0:
+                    time.sleep(ahead)
+        if truncate_at is not None:
+            server.count('truncated')
+            self.close_connection = True
+            return
+        if server.chunked:
+            self.wfile.write(b'0\r\n\r\n')
+
+
+def start_server(log, **settings):
+    """
+    start a stand-in server on a background thread.
+    :param log: the StandInLog to serve
+    :param settings: StandInServer settings
+    :return: the server, its url property is the base url to use.
+    """
+    server = StandInServer(log, **settings)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve synthetic LoTW data on this computer')
+    parser.add_argument('--debug', action='store_true', help='show logging informational output')
+    parser.add_argument('--info', action='store_true', help='show informational diagnostic output')
+    parser.add_argument('--port', type=int, default=0, help='port to listen on, default is any free port')
+    parser.add_argument('--qsos', type=int, default=10000, help='number of QSOs in the log')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for the log and failures')
+    parser.add_argument('--callsign', type=str, default='N1KDO', help='callsign of the log')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to wait before each response')
+    parser.add_argument('--bandwidth', type=int, default=0, help='bytes per second to send, 0 for no limit')
+    parser.add_argument('--chunk-size', type=int, default=65536, help='bytes to write at a time')
+    parser.add_argument('--chunked', action='store_true', help='use chunked transfer encoding')
+    parser.add_argument('--no-gzip', action='store_true', help='never gzip responses')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of requests that get a 503')
+    parser.add_argument('--truncate-rate', type=float, default=0.0, help='fraction of responses cut off early')
+    parser.add_argument('--shuffle', action='store_true', help='send reports in a random order, not watermark order')
+    args = parser.parse_args()
+
+    log_format = '%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s'
+    log_date_format = '%Y-%m-%d %H:%M:%S'
+    if args.debug:
+        logging.basicConfig(format=log_format, datefmt=log_date_format, level=logging.DEBUG)
+    elif args.info:
+        logging.basicConfig(format=log_format, datefmt=log_date_format, level=logging.INFO)
+    else:
+        logging.basicConfig(format=log_format, datefmt=log_date_format, level=logging.WARNING)
+
+    logging.Formatter.converter = time.gmtime
+
+    log = StandInLog(args.qsos, seed=args.seed, callsign=args.callsign.upper(), shuffle=args.shuffle)
+    server = StandInServer(log, port=args.port, latency=args.latency, bandwidth=args.bandwidth,
+                           chunk_size=args.chunk_size, chunked=args.chunked, use_gzip=not args.no_gzip,
+                           fail_rate=args.fail_rate, truncate_rate=args.truncate_rate, seed=args.seed)
+    print(f'serving {len(log.qsos)} QSOs and {len(log.cards)} QSL cards at {server.url}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
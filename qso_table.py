@@ -0,0 +1,398 @@
+"""
+qso_table.py -- columnar NumPy representation of the QSO fields used for analysis.
+
+each column is a NumPy array with one entry per QSO, in the order the QSOs were read.
+strings are stored as small integer codes:
+  band is the index into adif.BANDS, -1 if unknown.
+  mode is the index of the LoTW mode group in adif.MODES, -1 if unknown.
+  grid is a 4-character grid square code, see grid_code(), -1 if missing.
+  call is the index into the table's calls list.
+  dxcc is the index into the table's dxccs list, the dxcc strings as they are in the QSOs, '0' if missing.
+"""
+import calendar
+import datetime
+import itertools
+import logging
+
+import numpy as np
+
+import adif
+
+BAND_CODES = {band: i for i, band in enumerate(adif.BANDS)}
+MODE_CODES = {mode: i for i, mode in enumerate(adif.MODES)}
+COLUMN_TYPES = {'timestamp': np.int64,
+                'qso_date': np.int32,
+                'band': np.int8,
+                'mode': np.int8,
+                'dxcc': np.int32,
+                'qsl_rcvd': np.bool_,
+                'lotw_qsl_rcvd': np.bool_,
+                'grid': np.int16,
+                'call': np.int32,
+                'vucc_grid_offsets': np.int32,
+                'vucc_grid_codes': np.int16,
+                }
+
+
+def grid_code(grid):
+    """
+    encode the first 4 characters of a grid square as an int from 0 to 32399.
+    :return: the code, or -1 if grid is not a valid grid square.
+    """
+    if grid is None or len(grid) < 4:
+        return -1
+    field_lon = ord(grid[0].upper()) - 65
+    field_lat = ord(grid[1].upper()) - 65
+    square_lon = ord(grid[2]) - 48
+    square_lat = ord(grid[3]) - 48
+    if not (0 <= field_lon < 18 and 0 <= field_lat < 18 and 0 <= square_lon < 10 and 0 <= square_lat < 10):
+        return -1
+    return ((field_lon * 18 + field_lat) * 10 + square_lon) * 10 + square_lat
+
+
+def grid_code_array(grids):
+    """
+    grid_code() for a list of grid squares at once.
+    :param grids: list of grid squares, None for a missing grid square.
+    :return: int16 array of the grid codes, or None if the grid squares are not all ascii.
+    """
+    try:
+        chars = np.array([grid or '' for grid in grids], dtype='S4')
+    except UnicodeEncodeError:
+        return None
+    chars = chars.view(np.uint8).reshape(-1, 4).astype(np.int32)
+    fields = chars[:, 0:2] - np.where((chars[:, 0:2] >= 97) & (chars[:, 0:2] <= 122), 32, 0) - 65
+    squares = chars[:, 2:4] - 48
+    valid = ((fields >= 0) & (fields < 18)).all(axis=1) & ((squares >= 0) & (squares < 10)).all(axis=1)
+    codes = ((fields[:, 0] * 18 + fields[:, 1]) * 10 + squares[:, 0]) * 10 + squares[:, 1]
+    return np.where(valid, codes, -1).astype(np.int16)
+
+
+def grid_name(code):
+    """
+    decode a grid square code made by grid_code().
+    """
+    code, square_lat = divmod(int(code), 10)
+    code, square_lon = divmod(code, 10)
+    field_lon, field_lat = divmod(code, 18)
+    return chr(field_lon + 65) + chr(field_lat + 65) + chr(square_lon + 48) + chr(square_lat + 48)
+
+
+def qso_date_code(qso_date):
+    return int(qso_date) if qso_date is not None and qso_date.isdigit() else 0
+
+
+def qso_date_code_array(qso_dates, qso_date_codes):
+    """
+    qso_date_code() for a list of qso_dates at once.  dates that are not 8 ascii digits are
+    looked up one at a time in qso_date_codes.
+    :return: int32 array of the codes
+    """
+    try:
+        chars = np.array([qso_date or '' for qso_date in qso_dates], dtype='S9')
+    except UnicodeEncodeError:
+        return np.array([qso_date_codes[qso_date] for qso_date in qso_dates], dtype=np.int32)
+    chars = chars.view(np.uint8).reshape(-1, 9).astype(np.int32)
+    digits = chars[:, 0:8] - 48
+    valid = ((digits >= 0) & (digits <= 9)).all(axis=1) & (chars[:, 8] == 0)
+    codes = (digits * (10 ** np.arange(7, -1, -1, dtype=np.int32))).sum(axis=1, dtype=np.int32)
+    for i in np.flatnonzero(~valid).tolist():
+        codes[i] = qso_date_codes[qso_dates[i]]
+    return codes
+
+
+def band_code(band):
+    return BAND_CODES.get((band or '').upper(), -1)
+
+
+def mode_code(mode):
+    return MODE_CODES.get(mode, -1)
+
+
+def qsl_rcvd_code(qsl_rcvd):
+    return (qsl_rcvd or 'N').lower() == 'y'
+
+
+class FieldCodes(dict):
+    """
+    dict of field value to column code that makes the code for a value the first time it is looked up.
+    """
+
+    def __init__(self, code_function):
+        super().__init__()
+        self.code_function = code_function
+
+    def __missing__(self, value):
+        code = self[value] = self.code_function(value)
+        return code
+
+
+def day_epoch(iso_date, day_epochs):
+    epoch = day_epochs.get(iso_date)
+    if epoch is None:
+        epoch = day_epochs[iso_date] = calendar.timegm(datetime.date.fromisoformat(iso_date).timetuple())
+    return epoch
+
+
+def qso_timestamp(qso, day_epochs):
+    """
+    :return: the QSO time in seconds since the epoch, computed the same way crunch_data does.
+    """
+    qso_date = qso.get('qso_date')
+    app_lotw_qso_timestamp = qso.get('app_lotw_qso_timestamp')
+    if app_lotw_qso_timestamp is None:
+        if qso_date is None:
+            return 0
+        qso_time = qso.get('time_on') or ''
+        if len(qso_time) != 6:
+            qso_time = '120000'  # if no time, make midday
+        return (day_epoch(qso_date[0:4] + '-' + qso_date[4:6] + '-' + qso_date[6:8], day_epochs) +
+                int(qso_time[0:2]) * 3600 + int(qso_time[2:4]) * 60 + int(qso_time[4:6]))
+    if isinstance(app_lotw_qso_timestamp, datetime.datetime):
+        return int(app_lotw_qso_timestamp.timestamp())
+    if len(app_lotw_qso_timestamp) == 20 and app_lotw_qso_timestamp[19] == 'Z':  # LoTW format
+        return (day_epoch(app_lotw_qso_timestamp[0:10], day_epochs) +
+                int(app_lotw_qso_timestamp[11:13]) * 3600 +
+                int(app_lotw_qso_timestamp[14:16]) * 60 +
+                int(app_lotw_qso_timestamp[17:19]))
+    app_lotw_qso_timestamp = app_lotw_qso_timestamp.replace('Z', '+00:00')
+    return int(datetime.datetime.fromisoformat(app_lotw_qso_timestamp).timestamp())
+
+
+def ascii_digits(strings, length, positions):
+    """
+    :param strings: list of strings of length characters
+    :param positions: the positions of the digits to get
+    :return: (len(strings), len(positions)) int32 array of the digit values, which are out of 0-9 for other
+             characters, and the (len(strings), length) array of character codes.  None, None if not all ascii.
+    """
+    try:
+        chars = np.array(strings, dtype=f'S{length}')
+    except UnicodeEncodeError:
+        return None, None
+    chars = chars.view(np.uint8).reshape(-1, length).astype(np.int32)
+    return chars[:, positions] - 48, chars
+
+
+def digit_epochs(digits):
+    """
+    convert dates and times all at once.
+    :param digits: (n, 14) int array of the values of the YYYYMMDDHHMMSS digits
+    :return: int64 array of seconds since the epoch, and a bool array that is True where the digits are not a
+             valid date and time.
+    """
+    invalid = ((digits < 0) | (digits > 9)).any(axis=1)
+    digits[invalid] = 0
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 4] * 10 + digits[:, 5]
+    day = digits[:, 6] * 10 + digits[:, 7]
+    invalid |= (year < 1) | (month < 1) | (month > 12)
+    year[invalid] = 1970
+    month[invalid] = 1
+    months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    month_days = (months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')
+    invalid |= (day < 1) | (day > month_days.astype(np.int32))
+    day[invalid] = 1
+    days = (months.astype('datetime64[D]') + (day - 1)).astype(np.int64)
+    seconds = ((digits[:, 8] * 10 + digits[:, 9]) * 3600 + (digits[:, 10] * 10 + digits[:, 11]) * 60 +
+               digits[:, 12] * 10 + digits[:, 13])
+    return days * 86400 + seconds, invalid
+
+
+def qso_timestamps(qsos, day_epochs):
+    """
+    :return: int64 array of the qso_timestamp() of each of qsos.
+             LoTW format timestamps, and qso_date and time_on when there is no timestamp, are converted all at once.
+             anything else goes through qso_timestamp() one QSO at a time.
+    """
+    result = np.zeros(len(qsos), dtype=np.int64)
+    timestamps = [qso.get('app_lotw_qso_timestamp') for qso in qsos]
+    lotw = [i for i, timestamp in enumerate(timestamps)
+            if isinstance(timestamp, str) and len(timestamp) == 20 and timestamp[19] == 'Z']
+    dated = [i for i, timestamp in enumerate(timestamps) if timestamp is None]
+    dates = [qsos[i].get('qso_date') for i in dated]
+    dated = [i for i, qso_date in zip(dated, dates) if isinstance(qso_date, str) and len(qso_date) == 8]
+    others = sorted(set(range(len(qsos))).difference(lotw, dated)) if len(lotw) + len(dated) < len(qsos) else []
+
+    if len(lotw) > 0:
+        digits, chars = ascii_digits([timestamps[i] for i in lotw], 20,
+                                     [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18])
+        if digits is None:
+            others.extend(lotw)
+        else:
+            epochs, invalid = digit_epochs(digits)
+            invalid |= (chars[:, 4] != 45) | (chars[:, 7] != 45)
+            result[lotw] = epochs
+            others.extend(np.asarray(lotw)[invalid].tolist())
+    if len(dated) > 0:
+        date_digits, _ = ascii_digits([qsos[i]['qso_date'] for i in dated], 8, list(range(8)))
+        times = [qsos[i].get('time_on') or '' for i in dated]
+        # if no time, make midday
+        time_digits, _ = ascii_digits([qso_time if len(qso_time) == 6 else '120000' for qso_time in times], 6,
+                                      list(range(6)))
+        if date_digits is None or time_digits is None:
+            others.extend(dated)
+        else:
+            epochs, invalid = digit_epochs(np.concatenate((date_digits, time_digits), axis=1))
+            result[dated] = epochs
+            others.extend(np.asarray(dated)[invalid].tolist())
+    for i in others:
+        result[i] = qso_timestamp(qsos[i], day_epochs)
+    return result
+
+
+class QsoTable:
+    """
+    columnar table of QSOs.
+    columns:
+      timestamp      int64 seconds since the epoch, computed the same way crunch_data does.
+      qso_date       int32 YYYYMMDD, 0 if missing.
+      band           int8 code
+      mode           int8 code
+      dxcc           int32 code
+      qsl_rcvd       bool, qsl_rcvd is 'y'
+      lotw_qsl_rcvd  bool, lotw_qsl_rcvd is 'y'
+      grid           int16 code of gridsquare
+      call           int32 code
+    vucc_grids are stored ragged: the grid codes for QSO i are
+    vucc_grid_codes[vucc_grid_offsets[i]:vucc_grid_offsets[i + 1]].
+    """
+
+    def __init__(self, columns, calls, dxccs):
+        self.timestamp = columns['timestamp']
+        self.qso_date = columns['qso_date']
+        self.band = columns['band']
+        self.mode = columns['mode']
+        self.dxcc = columns['dxcc']
+        self.qsl_rcvd = columns['qsl_rcvd']
+        self.lotw_qsl_rcvd = columns['lotw_qsl_rcvd']
+        self.grid = columns['grid']
+        self.call = columns['call']
+        self.vucc_grid_offsets = columns['vucc_grid_offsets']
+        self.vucc_grid_codes = columns['vucc_grid_codes']
+        self.calls = calls
+        self.dxccs = dxccs
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    @property
+    def confirmed(self):
+        return self.qsl_rcvd | self.lotw_qsl_rcvd
+
+    def vucc_grids(self, index):
+        return self.vucc_grid_codes[self.vucc_grid_offsets[index]:self.vucc_grid_offsets[index + 1]]
+
+    def take(self, indices):
+        """
+        :return: a new table with only the QSOs at indices, in that order.
+        """
+        indices = np.asarray(indices)
+        counts = np.diff(self.vucc_grid_offsets)[indices]
+        offsets = np.zeros(len(indices) + 1, dtype=np.int32)
+        np.cumsum(counts, out=offsets[1:])
+        starts = self.vucc_grid_offsets[:-1][indices]
+        grid_indices = np.repeat(starts - offsets[:-1], counts) + np.arange(offsets[-1], dtype=np.int32)
+        columns = {'timestamp': self.timestamp[indices],
+                   'qso_date': self.qso_date[indices],
+                   'band': self.band[indices],
+                   'mode': self.mode[indices],
+                   'dxcc': self.dxcc[indices],
+                   'qsl_rcvd': self.qsl_rcvd[indices],
+                   'lotw_qsl_rcvd': self.lotw_qsl_rcvd[indices],
+                   'grid': self.grid[indices],
+                   'call': self.call[indices],
+                   'vucc_grid_offsets': offsets,
+                   'vucc_grid_codes': self.vucc_grid_codes[grid_indices],
+                   }
+        return QsoTable(columns, self.calls, self.dxccs)
+
+    def sorted(self):
+        """
+        :return: a new table sorted by timestamp.  the sort is stable, like crunch_data's.
+        """
+        return self.take(np.argsort(self.timestamp, kind='stable'))
+
+    @staticmethod
+    def from_qsos(qsos, batch_size=8192):
+        """
+        build a table from an iterable of QSO dicts.  the QSOs are read batch_size at a time,
+        and each column of a batch is filled in one pass, so this can be fed straight from adif.iter_adif().
+        """
+        column_batches = {name: [np.zeros(0, dtype=dtype)] for name, dtype in COLUMN_TYPES.items()}
+        column_batches['vucc_grid_offsets'] = [np.zeros(1, dtype=np.int32)]
+        qso_date_codes = FieldCodes(qso_date_code)
+        band_codes = FieldCodes(band_code)
+        mode_codes = FieldCodes(mode_code)
+        qsl_rcvd_codes = FieldCodes(qsl_rcvd_code)
+        grid_codes = FieldCodes(grid_code)
+        calls = {}
+        # call codes are given out in the order the calls are first seen.
+        call_codes = FieldCodes(lambda call: calls.setdefault(call or '', len(calls)))
+        # dxcc codes too, the dxcc strings are kept as they are, so '001' and '1' are different entities.
+        dxccs = {}
+        dxcc_codes = FieldCodes(lambda dxcc: dxccs.setdefault(dxcc or '0', len(dxccs)))
+        day_epochs = {}
+        vucc_grid_count = 0
+        qso_count = 0
+
+        qsos = iter(qsos)
+        while True:
+            batch = list(itertools.islice(qsos, batch_size))
+            if len(batch) == 0:
+                break
+            qso_count += len(batch)
+
+            column_batches['timestamp'].append(qso_timestamps(batch, day_epochs))
+            column_batches['qso_date'].append(qso_date_code_array([qso.get('qso_date') for qso in batch],
+                                                                  qso_date_codes))
+            column_batches['band'].append(np.array([band_codes[qso.get('band')] for qso in batch], dtype=np.int8))
+            modes = [qso.get('app_lotw_modegroup') for qso in batch]
+            for i in [i for i, mode in enumerate(modes) if mode is None]:
+                adif_mode = batch[i].get('mode')
+                if adif_mode is not None:
+                    modes[i] = adif.adif_mode_to_lotw_modegroup(adif_mode)
+            column_batches['mode'].append(np.array([mode_codes[mode] for mode in modes], dtype=np.int8))
+            column_batches['dxcc'].append(np.array([dxcc_codes[qso.get('dxcc')] for qso in batch], dtype=np.int32))
+            column_batches['qsl_rcvd'].append(np.array([qsl_rcvd_codes[qso.get('qsl_rcvd')] for qso in batch],
+                                                       dtype=np.bool_))
+            column_batches['lotw_qsl_rcvd'].append(np.array([qsl_rcvd_codes[qso.get('lotw_qsl_rcvd')]
+                                                            for qso in batch], dtype=np.bool_))
+            grids = [qso.get('gridsquare') for qso in batch]
+            grid_column = grid_code_array(grids)
+            if grid_column is None:
+                grid_column = np.array([grid_codes[grid] for grid in grids], dtype=np.int16)
+            column_batches['grid'].append(grid_column)
+            column_batches['call'].append(np.array([call_codes[qso.get('call')] for qso in batch], dtype=np.int32))
+
+            vucc_grid_counts = np.zeros(len(batch), dtype=np.int32)
+            vucc_grid_codes = []
+            vucc_grids = [qso.get('vucc_grids') for qso in batch]
+            for i in [i for i, grids in enumerate(vucc_grids) if grids is not None]:
+                grids = vucc_grids[i].split(',')
+                vucc_grid_counts[i] = len(grids)
+                vucc_grid_codes.extend(grid_codes[grid] for grid in grids)
+            column_batches['vucc_grid_offsets'].append(vucc_grid_count + np.cumsum(vucc_grid_counts, dtype=np.int32))
+            column_batches['vucc_grid_codes'].append(np.array(vucc_grid_codes, dtype=np.int16))
+            vucc_grid_count += len(vucc_grid_codes)
+
+        columns = {name: np.concatenate(batches) for name, batches in column_batches.items()}
+        logging.info(f'built QSO table of {qso_count} QSOs')
+        return QsoTable(columns, list(calls), list(dxccs))
+
+
+def read_qso_table(adif_file_name):
+    """
+    read an adif file straight into a QsoTable, without keeping the QSO dicts.
+    :param adif_file_name:  the name of the file to read.
+    :return: adif header as dict, QsoTable in file order
+    """
+    logging.info(f'reading adif file {adif_file_name} into QSO table')
+    qsos = adif.iter_adif(adif_file_name)
+    try:
+        header = next(qsos)
+    except FileNotFoundError as fnfe:
+        logging.warning(f'could not read file {adif_file_name}')
+        logging.warning(fnfe)
+        return None, None
+    return header, QsoTable.from_qsos(qsos)
@@ -0,0 +1,51 @@
+"""
+show records from an adif file.
+
+the file is memory-mapped, so only the requested records are parsed.
+"""
+import argparse
+import logging
+import time
+from adif import MappedAdifFile
+
+__version__ = '0.0.1'
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Show records from an ADIF file')
+    parser.add_argument('--debug', action='store_true', help='show logging informational output')
+    parser.add_argument('--info', action='store_true', help='show informational diagnostic output')
+    parser.add_argument('filename', type=str, help='name of ADIF file')
+    parser.add_argument('record', nargs='*', type=int, help='record number(s) to show, starting at 0')
+    args = parser.parse_args()
+
+    log_format = '%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s'
+    log_date_format = '%Y-%m-%d %H:%M:%S'
+    if args.debug:
+        logging.basicConfig(format=log_format, datefmt=log_date_format, level=logging.DEBUG)
+    elif args.info:
+        logging.basicConfig(format=log_format, datefmt=log_date_format, level=logging.INFO)
+    else:
+        logging.basicConfig(format=log_format, datefmt=log_date_format, level=logging.WARNING)
+
+    logging.Formatter.converter = time.gmtime
+
+    with MappedAdifFile(args.filename) as adif_file:
+        print(f'{args.filename}: {len(adif_file)} QSOs')
+        for key, value in adif_file.header.items():
+            print(f'  {key}: {value}')
+        for record_number in args.record:
+            try:
+                qso = adif_file[record_number]
+            except IndexError:
+                print(f'no record {record_number}')
+                continue
+            print()
+            print(f'record {record_number}')
+            for key, value in qso.items():
+                print(f'  {key}: {value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,460 @@
+"""
+tests for adif.py.  run with pytest.
+"""
+import copy
+import http.client
+import os
+import random
+
+import pytest
+
+import adif
+import lotw_standin
+
+SAMPLE_ADIF = ('ADIF export for the tests\n'
+               '<ADIF_VER:5>3.1.0\n<programid:4>test\n<EOH>\n\n'
+               '<CALL:5>K1ABC <BAND:3>20M <MODE:2>CW <QSO_DATE:8:D>20240102 <TIME_ON:6>120000 '
+               '<comment:7>a<b>c<d <app_lotw_modegroup:2>CW <qsl_rcvd:1>Y <EOR>\n'
+               '<call:5>W1XYZ<band:3>40m<mode:3>SSB<qso_date:8>20240101<time_on:4>0930<notes:0> <eor>\n'
+               'junk between records\n'
+               '<call:4>N1KD<band:2>6M<mode:3>FT8<qso_date:8>20240103<time_on:6>235959<gridsquare:6>FN42ab<eor>\n')
+
+SAMPLE_HEADER = {'adif_ver': '3.1.0', 'programid': 'test'}
+
+SAMPLE_QSOS = [
+    {'call': 'W1XYZ', 'band': '40m', 'mode': 'SSB', 'qso_date': '20240101', 'time_on': '0930', 'notes': ''},
+    {'call': 'K1ABC', 'band': '20M', 'mode': 'CW', 'qso_date': '20240102', 'time_on': '120000', 'comment': 'a<b>c<d',
+     'app_lotw_modegroup': 'CW', 'qsl_rcvd': 'Y'},
+    {'call': 'N1KD', 'band': '6M', 'mode': 'FT8', 'qso_date': '20240103', 'time_on': '235959',
+     'gridsquare': 'FN42ab'},
+]
+
+
+def write_text(path, text):
+    with open(path, 'w', encoding='iso-8859-1', newline='') as f:
+        f.write(text)
+    return str(path)
+
+
+def random_qsos(rng, count):
+    """
+    :return: list of count QSOs with unique qso_key, many of them on the same call, band and date.
+    """
+    qsos = {}
+    while len(qsos) < count:
+        qso = {'call': rng.choice(['K1ABC', 'W1XYZ', 'N1KDO', 'VE3AAA']),
+               'band': rng.choice(['20M', '40M']),
+               'app_lotw_modegroup': rng.choice(['CW', 'DATA']),
+               'qso_date': rng.choice(['20240101', '20240102']),
+               'time_on': f'{rng.randint(0, 23):02d}{rng.randint(0, 59):02d}00',
+               'qsl_rcvd': rng.choice(['Y', 'N', None]),
+               }
+        if qso['qsl_rcvd'] is None:
+            del qso['qsl_rcvd']
+        qsos[adif.qso_key(qso)] = qso
+    return list(qsos.values())
+
+
+def test_read_adif_file(tmp_path):
+    adif_file_name = write_text(tmp_path / 'sample.adif', SAMPLE_ADIF)
+    header, qsos = adif.read_adif_file(adif_file_name)
+    assert header == SAMPLE_HEADER
+    assert qsos == SAMPLE_QSOS
+
+
+def test_read_adif_file_compact(tmp_path):
+    adif_file_name = write_text(tmp_path / 'sample.adif', SAMPLE_ADIF)
+    header, qsos = adif.read_adif_file(adif_file_name, compact=True)
+    assert header == SAMPLE_HEADER
+    assert all(isinstance(qso, adif.CompactQso) for qso in qsos)
+    assert [dict(qso) for qso in qsos] == SAMPLE_QSOS
+
+
+def test_read_adif_file_missing(tmp_path):
+    assert adif.read_adif_file(str(tmp_path / 'missing.adif')) == (None, [])
+
+
+def test_chunk_boundaries(tmp_path):
+    # every tag and value is split across chunks by one of these sizes.
+    adif_file_name = write_text(tmp_path / 'sample.adif', SAMPLE_ADIF)
+    expected = list(adif.iter_adif(adif_file_name))
+    for chunk_size in range(1, 40):
+        records = adif.adif_records(adif.adif_file_chunks(adif_file_name, chunk_size=chunk_size))
+        assert list(adif.adif_header_and_qsos(records, adif_file_name)) == expected, chunk_size
+
+
+def test_file_ranges(tmp_path):
+    adif_file_name = write_text(tmp_path / 'sample.adif', SAMPLE_ADIF * 5)
+    expected = list(adif.adif_records(adif.adif_file_chunks(adif_file_name)))
+    for count in range(1, 8):
+        ranges = adif.adif_file_ranges(adif_file_name, count)
+        for compact in (False, True):
+            records = [(name, dict(fields)) for start, end in ranges
+                       for name, fields in adif.adif_range_records(
+                           adif.read_adif_range(adif_file_name, start, end, compact), compact)]
+            assert records == expected, (count, compact)
+
+
+def test_later_header_replaces_header(tmp_path):
+    adif_file_name = write_text(tmp_path / 'headers.adif',
+                                '<programid:3>one<eoh><call:4>N1KD<eor><programid:3>two<eoh><call:4>W1AW<eor>')
+    header, qsos = adif.read_adif_file(adif_file_name)
+    assert header == {'programid': 'two'}
+    assert qsos == [{'call': 'N1KD'}, {'call': 'W1AW'}]
+
+
+def test_no_header(tmp_path):
+    adif_file_name = write_text(tmp_path / 'no_header.adif', '<call:4>N1KD<eor>')
+    assert adif.read_adif_file(adif_file_name) == ({}, [{'call': 'N1KD'}])
+
+
+@pytest.mark.parametrize('text', [
+    SAMPLE_ADIF,
+    # an empty value consumes the next char, here the '<' of <eor>, so the two QSOs are one record.
+    '<eoh><call:4>N1KD<notes:0><eor><call:4>W1AW<eor>',
+    # a value that holds the text <eor>.
+    '<eoh><call:4>N1KD<comment:10>ab<eor>cdef<eor><call:4>W1AW<eor>',
+    # the last record is not finished.
+    '<eoh><call:4>N1KD<eor><call:4>W1AW',
+])
+def test_stream_parser_matches_adif_records(text):
+    expected = list(adif.adif_records((text,)))
+    for piece_size in range(1, len(text) + 1):
+        parser = adif.AdifStreamParser()
+        records = []
+        for start in range(0, len(text), piece_size):
+            records.extend(parser.feed(text[start:start + piece_size]))
+        records.extend(parser.finish())
+        assert records == expected, piece_size
+
+
+def test_stream_parser_random_pieces():
+    rng = random.Random(1)
+    values = ['', 'K1ABC', 'a<b', 'x>y', '<eor>', 'ab<eor>cd', '<eoh>']
+    for _ in range(500):
+        parts = []
+        for _ in range(rng.randint(0, 14)):
+            if rng.random() < 0.25:
+                parts.append(rng.choice(['<eoh>', '<eor>', '<EoR>', '<eor>\n']))
+            else:
+                value = rng.choice(values)
+                parts.append(f'<{rng.choice(["call", "BAND", "Comment"])}:{len(value)}>{value}')
+        text = ''.join(parts)
+        parser = adif.AdifStreamParser()
+        records = []
+        start = 0
+        while start < len(text):
+            end = start + rng.randint(1, 12)
+            records.extend(parser.feed(text[start:end]))
+            start = end
+        records.extend(parser.finish())
+        assert records == list(adif.adif_records((text,))), text
+
+
+def test_write_and_read_back(tmp_path):
+    adif_file_name = str(tmp_path / 'written.adif')
+    header = dict(SAMPLE_HEADER)  # the programid is set to this program's.
+    adif.write_adif_file(header, copy.deepcopy(SAMPLE_QSOS), adif_file_name, abridge_results=False)
+    assert adif.read_adif_file(adif_file_name) == (header, SAMPLE_QSOS)
+    assert not os.path.exists(adif_file_name + '.tmp')
+
+
+def test_cache(tmp_path):
+    adif_file_name = write_text(tmp_path / 'sample.adif', SAMPLE_ADIF)
+    cache_file_name = adif_file_name + adif.ADIF_CACHE_SUFFIX
+    assert adif.read_adif_file(adif_file_name, cache=True) == (SAMPLE_HEADER, SAMPLE_QSOS)
+    assert os.path.exists(cache_file_name)
+    assert adif.read_adif_cache(adif_file_name, adif.adif_file_identity(adif_file_name)) == \
+        (SAMPLE_HEADER, SAMPLE_QSOS)
+    header, qsos = adif.read_adif_file(adif_file_name, cache=True, compact=True)
+    assert header == SAMPLE_HEADER
+    assert [dict(qso) for qso in qsos] == SAMPLE_QSOS
+
+
+def test_cache_same_size_and_time(tmp_path):
+    # the content hash catches a change that keeps the size and the modification time.
+    adif_file_name = write_text(tmp_path / 'sample.adif', SAMPLE_ADIF)
+    adif.read_adif_file(adif_file_name, cache=True)
+    stat = os.stat(adif_file_name)
+    write_text(adif_file_name, SAMPLE_ADIF.replace('K1ABC', 'K1ABD'))
+    os.utime(adif_file_name, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert adif.adif_file_identity(adif_file_name) == (adif.ADIF_CACHE_VERSION, stat.st_size, stat.st_mtime_ns)
+    assert adif.read_adif_cache(adif_file_name, adif.adif_file_identity(adif_file_name)) is None
+    _, qsos = adif.read_adif_file(adif_file_name, cache=True)
+    assert qsos[1]['call'] == 'K1ABD'
+    _, qsos = adif.read_adif_file(adif_file_name, cache=True)
+    assert qsos[1]['call'] == 'K1ABD'
+
+
+@pytest.mark.parametrize('cache_text', [
+    '',
+    'not json\n',
+    '[1, 2, 3]\n[{}, []]',
+    'cafe',
+])
+def test_cache_bad_file(tmp_path, cache_text):
+    adif_file_name = write_text(tmp_path / 'sample.adif', SAMPLE_ADIF)
+    write_text(adif_file_name + adif.ADIF_CACHE_SUFFIX, cache_text)
+    assert adif.read_adif_file(adif_file_name, cache=True) == (SAMPLE_HEADER, SAMPLE_QSOS)
+
+
+def test_cache_bad_contents(tmp_path):
+    # a cache with the right identity that does not hold a header and QSOs is not used.
+    adif_file_name = write_text(tmp_path / 'sample.adif', SAMPLE_ADIF)
+    identity = adif.adif_file_identity(adif_file_name) + (adif.adif_file_digest(adif_file_name),)
+    adif.write_adif_cache(adif_file_name, identity, SAMPLE_HEADER, ['not a QSO'])
+    assert adif.read_adif_cache(adif_file_name, adif.adif_file_identity(adif_file_name)) is None
+    assert adif.read_adif_file(adif_file_name, cache=True) == (SAMPLE_HEADER, SAMPLE_QSOS)
+
+
+def test_adif_tail_appends(tmp_path):
+    adif_file_name = write_text(tmp_path / 'contest.adif', '<programid:4>test<eoh>\n<call:4>N1KD<eor>\n<call:4>W1')
+    tail = adif.AdifTail(adif_file_name)
+    assert tail.refresh() == [{'call': 'N1KD'}]
+    assert tail.header == {'programid': 'test'}
+    assert tail.refresh() == []
+    with open(adif_file_name, 'a', encoding='iso-8859-1') as f:
+        f.write('AW<eor>\n<call:5>K1ABC<eor>\n')
+    assert tail.refresh() == [{'call': 'W1AW'}, {'call': 'K1ABC'}]
+    assert tail.qsos == [{'call': 'N1KD'}, {'call': 'W1AW'}, {'call': 'K1ABC'}]
+
+
+def test_adif_tail_rewrites(tmp_path):
+    adif_file_name = write_text(tmp_path / 'contest.adif', '<programid:3>one<eoh>\n<call:4>N1KD<eor>\n')
+    tail = adif.AdifTail(adif_file_name)
+    tail.refresh()
+    # same size, different contents.
+    write_text(adif_file_name, '<programid:3>two<eoh>\n<call:4>W1AW<eor>\n')
+    assert tail.refresh() == [{'call': 'W1AW'}]
+    assert tail.header == {'programid': 'two'}
+    assert tail.qsos == [{'call': 'W1AW'}]
+    # shorter.
+    write_text(adif_file_name, '<eoh><call:4>N1KD<eor>')
+    assert tail.refresh() == [{'call': 'N1KD'}]
+    assert tail.header == {}
+    assert tail.qsos == [{'call': 'N1KD'}]
+
+
+def test_refresh_adif_tails(tmp_path):
+    tails = [adif.AdifTail(write_text(tmp_path / f'log{i}.adif', f'<eoh><call:4>N1K{i}<eor>')) for i in range(3)]
+    assert adif.refresh_adif_tails(tails, workers=2) == [[{'call': f'N1K{i}'}] for i in range(3)]
+
+
+def old_merge(header, qsos, new_qsos):
+    """
+    merge() as it was, with a linear scan, for comparison.
+    """
+    qso_dict = {}
+    for qso in qsos:
+        qso_dict[adif.qso_key(qso)] = qso
+    for new_qso in new_qsos:
+        key = adif.qso_key(new_qso)
+        found_qso = qso_dict.get(key)
+        if found_qso is None:
+            qso_dict[key] = new_qso
+            qsos.append(new_qso)
+        else:
+            for key in new_qso:
+                if key not in adif.qso_key_parts and found_qso.get(key) != new_qso.get(key):
+                    found_qso[key] = new_qso.get(key)
+    header['app_lotw_numrec'] = str(len(qsos))
+    return header, sorted(qsos, key=adif.qso_key)
+
+
+def old_combine_qsos(qso_list, qsl_cards):
+    """
+    combine_qsos() as it was, with a linear scan for each card, for comparison.
+    """
+    for card in qsl_cards:
+        card_merge_key = adif.get_key(card, adif.merge_key_parts)
+        found = False
+        for qso in qso_list:
+            if card_merge_key == adif.merge_key(qso):
+                if (qso.get('qsl_rcvd') or 'n').lower() != 'y':
+                    break
+                found = True
+                for k in card:
+                    if k not in adif.merge_key_parts:
+                        qso[k] = card[k]
+        if not found:
+            card['app_n1kdo_qso_combined'] = 'qslcards QSL added'
+            card['qsl_rcvd'] = 'y'
+            qso_list.append(card)
+    return qso_list
+
+
+def test_merge_matches_old_merge():
+    rng = random.Random(2)
+    for _ in range(50):
+        qsos = adif.sort_qsos(random_qsos(rng, rng.randint(0, 30)))
+        new_qsos = random_qsos(rng, rng.randint(0, 30))
+        for new_qso in new_qsos:
+            new_qso['app_lotw_rxqso'] = str(rng.randint(0, 3))
+        expected = old_merge({}, copy.deepcopy(qsos), copy.deepcopy(new_qsos))
+        assert adif.merge({}, copy.deepcopy(qsos), copy.deepcopy(new_qsos)) == expected
+
+
+def test_merge_index_is_kept():
+    qsos = adif.sort_qsos(copy.deepcopy(SAMPLE_QSOS))
+    qso_dict = adif.qso_index(qsos)
+    new_qso = {'call': 'N1KDO', 'band': '20M', 'qso_date': '20240104', 'time_on': '000000'}
+    _, qsos = adif.merge({}, qsos, [new_qso], qso_dict)
+    header, qsos = adif.merge({}, qsos, [dict(new_qso, qsl_rcvd='Y')], qso_dict)
+    assert header == {'app_lotw_numrec': '4'}
+    assert qsos[-1] == dict(new_qso, qsl_rcvd='Y')
+
+
+def test_combine_qsos_matches_old_combine_qsos():
+    rng = random.Random(3)
+    for _ in range(50):
+        qsos = random_qsos(rng, rng.randint(0, 30))
+        cards = [{key: qso[key] for key in adif.merge_key_parts} for qso in random_qsos(rng, rng.randint(0, 10))]
+        for card in cards:
+            card['qslrdate'] = '20240201'
+        expected = adif.sort_qsos(old_combine_qsos(copy.deepcopy(qsos), copy.deepcopy(cards)))
+        assert adif.combine_qsos(copy.deepcopy(qsos), copy.deepcopy(cards)) == expected
+
+
+def reference_match_qsos(left_qsos, right_qsos, tolerance):
+    """
+    match_qsos() the slow way: in time order, each left QSO takes the earliest unpaired right QSO in its window.
+    """
+    def entries(qsos):
+        return sorted((adif.qso_match_group(qso), adif.qso_seconds(qso), index) for index, qso in enumerate(qsos)
+                      if adif.qso_seconds(qso) is not None)
+
+    right_entries = entries(right_qsos)
+    right_of_left = {}
+    for group, seconds, index in entries(left_qsos):
+        for right_entry in right_entries:
+            if right_entry[0] == group and abs(right_entry[1] - seconds) <= tolerance \
+                    and right_entry[2] not in right_of_left.values():
+                right_of_left[index] = right_entry[2]
+                break
+    pairs = [(left_qsos[index], right_qsos[right_of_left[index]]) for index in sorted(right_of_left)]
+    left_only = [qso for index, qso in enumerate(left_qsos) if index not in right_of_left]
+    right_only = [qso for index, qso in enumerate(right_qsos) if index not in right_of_left.values()]
+    return pairs, left_only, right_only
+
+
+def test_match_qsos():
+    left = [{'call': 'K1ABC', 'band': '20M', 'mode': 'CW', 'qso_date': '20240101', 'time_on': '120000'},
+            {'call': 'K1ABC', 'band': '20M', 'mode': 'CW', 'qso_date': '20240101', 'time_on': '120500'},
+            {'call': 'W1AW', 'band': '40M', 'mode': 'FT8', 'qso_date': '20240101', 'time_on': '0000'},
+            {'call': 'N1KD', 'band': '40M', 'mode': 'SSB', 'qso_date': 'bad date', 'time_on': '0000'}]
+    right = [{'call': 'k1abc', 'band': '20m', 'app_lotw_modegroup': 'CW', 'qso_date': '20240101', 'time_on': '120130'},
+             {'call': 'W1AW', 'band': '40M', 'mode': 'FT4', 'qso_date': '20231231', 'time_on': '235930'},
+             {'call': 'N1KD', 'band': '40M', 'mode': 'SSB', 'qso_date': 'bad date', 'time_on': '0000'}]
+    pairs, left_only, right_only = adif.match_qsos(left, right, tolerance=120)
+    assert pairs == [(left[0], right[0]), (left[2], right[1])]
+    assert left_only == [left[1], left[3]]
+    assert right_only == [right[2]]
+    pairs, left_only, right_only = adif.match_qsos(left, right, tolerance=60)
+    assert pairs == [(left[2], right[1])]
+
+
+def test_match_qsos_matches_reference():
+    rng = random.Random(4)
+    for _ in range(200):
+        left = random_qsos(rng, rng.randint(0, 20))
+        right = random_qsos(rng, rng.randint(0, 20))
+        tolerance = rng.choice([0, 60, 600, 3600])
+        assert adif.match_qsos(left, right, tolerance) == reference_match_qsos(left, right, tolerance)
+
+
+def test_diff_qsos():
+    left = [{'call': 'K1ABC', 'band': '20M', 'qso_date': '20240101', 'time_on': '1200', 'rst_sent': '599'},
+            {'call': 'W1AW', 'band': '40M', 'qso_date': '20240101', 'time_on': '1300'},
+            {'call': 'N1KD', 'band': '6M', 'qso_date': '20240101', 'time_on': '1400', 'gridsquare': 'FN42'}]
+    right = [{'call': 'N1KD', 'band': '6M', 'qso_date': '20240101', 'time_on': '1400', 'gridsquare': 'FN43'},
+             {'call': 'K1ABC', 'band': '20M', 'qso_date': '20240101', 'time_on': '1200', 'rst_sent': '599'},
+             {'call': 'K1ABC', 'band': '20M', 'qso_date': '20240101', 'time_on': '1200', 'rst_sent': '579'},
+             {'call': 'VE3AAA', 'band': '20M', 'qso_date': '20240101', 'time_on': '1500'}]
+    left_only, right_only, different = adif.diff_qsos(left, right)
+    assert left_only == [left[1]]
+    assert right_only == [right[3]]
+    assert different == [(left[2], right[0], ['gridsquare'])]
+    # left QSOs are compared to the first right QSO with their key.
+    _, _, different = adif.diff_qsos(left, right, fields=['rst_sent'])
+    assert different == []
+    left_only, right_only, different = adif.diff_qsos(left, right, tolerance=60)
+    assert left_only == [left[1]]
+    assert right_only == [right[2], right[3]]
+    assert different == [(left[2], right[0], ['gridsquare'])]
+
+
+@pytest.fixture
+def standin():
+    server = lotw_standin.start_server(lotw_standin.StandInLog(2000), chunk_size=4096, use_gzip=False)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def report_params(server, **params):
+    report = {'url': server.url + lotw_standin.REPORT_PATH, 'login': 'test', 'password': 'test',
+              'qso_query': '1', 'qso_qsl': 'no', 'qso_owncall': 'N1KDO', 'qso_qsldetail': 'yes'}
+    report.update(params)
+    return report
+
+
+def test_resume_from_checkpoint(tmp_path, standin):
+    adif_file_name = str(tmp_path / 'lotw.adif')
+    with adif.LotwClient(retries=0) as client:
+        expected = adif.call_lotw(client=client, **report_params(standin))
+        full_bytes = standin.stats['bytes_sent']
+        standin.truncate_rate = 1.0
+        with pytest.raises(http.client.HTTPException):
+            adif.call_lotw_resumable('qso_qsorxsince', 'app_lotw_rxqso', client=client,
+                                     **report_params(standin, filename=adif_file_name, qso_qsorxsince='1900-01-01'))
+        client.close()
+        query = adif.lotw_checkpoint_query(report_params(standin, filename=adif_file_name), 'qso_qsorxsince')
+        watermark, received_qsos = adif.read_lotw_checkpoint(adif_file_name, query)
+        assert watermark > '1900-01-01'
+        assert 0 < len(received_qsos) < len(expected[1])
+
+        standin.truncate_rate = 0.0
+        bytes_sent = standin.stats['bytes_sent']
+        header, qsos = adif.call_lotw_resumable('qso_qsorxsince', 'app_lotw_rxqso', client=client,
+                                                **report_params(standin, filename=adif_file_name,
+                                                                qso_qsorxsince='1900-01-01'))
+    assert qsos == expected[1]
+    assert header['app_lotw_lastqsorx'] == expected[0]['app_lotw_lastqsorx']
+    # only the QSOs after the watermark were sent again.
+    assert standin.stats['bytes_sent'] - bytes_sent < full_bytes * 0.75
+    assert not os.path.exists(adif_file_name + adif.LOTW_CHECKPOINT_SUFFIX)
+    assert adif.read_adif_file(adif_file_name)[1] == expected[1]
+
+
+def test_checkpoint_for_other_query(tmp_path, standin):
+    adif_file_name = str(tmp_path / 'lotw.adif')
+    standin.truncate_rate = 1.0
+    with pytest.raises(http.client.HTTPException):
+        adif.call_lotw_resumable('qso_qsorxsince', 'app_lotw_rxqso',
+                                 **report_params(standin, filename=adif_file_name, qso_qsorxsince='1900-01-01'))
+    standin.truncate_rate = 0.0
+    header, qsos = adif.call_lotw_resumable('qso_qsorxsince', 'app_lotw_rxqso',
+                                            **report_params(standin, filename=adif_file_name, qso_owncall='W1AW',
+                                                            qso_qsorxsince='1900-01-01'))
+    assert qsos == []
+
+
+def test_date_windows_resume(tmp_path, standin):
+    adif_file_name = str(tmp_path / 'lotw.adif')
+    windows = adif.lotw_date_windows(4, '2005-01-01', '2024-12-31')
+    expected = adif.call_lotw(**report_params(standin))[1]
+    full_bytes = standin.stats['bytes_sent']
+    with adif.LotwClient(retries=0) as client:
+        standin.truncate_rate = 1.0
+        with pytest.raises(Exception):
+            adif.get_lotw_adif('test', 'test', 'N1KDO', filename=adif_file_name, client=client,
+                               date_windows=windows, url=standin.url + lotw_standin.REPORT_PATH)
+        assert len([name for name in os.listdir(tmp_path) if name.endswith(adif.LOTW_CHECKPOINT_SUFFIX)]) == 4
+        standin.truncate_rate = 0.0
+        bytes_sent = standin.stats['bytes_sent']
+        header, qsos = adif.get_lotw_adif('test', 'test', 'N1KDO', filename=adif_file_name, client=client,
+                                          date_windows=windows, url=standin.url + lotw_standin.REPORT_PATH)
+    assert qsos == expected
+    assert header['app_lotw_numrec'] == str(len(expected))
+    assert standin.stats['bytes_sent'] - bytes_sent < full_bytes * 0.75
+    assert sorted(os.listdir(tmp_path)) == ['lotw.adif']
@@ -0,0 +1,87 @@
+"""
+tests for the counts that adif_log_analyzer.py makes.  run with pytest.
+"""
+import contextlib
+import copy
+import io
+
+import adif_log_analyzer
+
+
+def qso(call, band, mode, qso_date, time_on, dxcc, qsl_rcvd='N', **fields):
+    fields.update({'call': call, 'band': band, 'mode': mode, 'qso_date': qso_date, 'time_on': time_on,
+                   'dxcc': dxcc, 'qsl_rcvd': qsl_rcvd})
+    return fields
+
+
+LOG = [
+    qso('K1ABC', '20M', 'CW', '20240101', '010000', '291', 'Y'),
+    qso('K1ABC', '40M', 'CW', '20240101', '020000', '291', 'Y'),
+    qso('VE3AAA', '20M', 'SSB', '20240102', '030000', '1'),
+    qso('VE3BBB', '20M', 'FT8', '20240102', '040000', '1', 'Y'),
+    qso('W1AW', '6M', 'FT8', '20240103', '050000', '291', 'Y', gridsquare='FN31pr'),
+    qso('N6XX', '6M', 'CW', '20240103', '060000', '291', gridsquare='CM97'),
+    qso('W6YY', '6M', 'CW', '20240103', '070000', '291', vucc_grids='CM97,CM98'),
+    qso('VK9DX', '20M', 'SSB', '20240104', '080000', '8', 'Y'),  # a deleted entity.
+    qso('AA1AA', '20M', 'SSB', '20240104', '090000', '0', 'Y'),  # no entity.
+    qso('N1KDO', '', 'CW', '20240104', '100000', '291', 'Y'),  # no band, not counted.
+    qso('VE3AAA', '15M', 'CW', '20240101', '000000', '1', 'Y'),  # out of order.
+]
+
+
+def crunch(qsos):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        bin_data = adif_log_analyzer.crunch_data(qsos)
+    return bin_data, output.getvalue()
+
+
+def test_crunch_data_totals():
+    bin_data, _ = crunch(LOG)
+    assert bin_data.num_days == 4
+    assert bin_data.bin_size == 1800
+    last = bin_data.data[-1]
+    assert last['total_worked'] == 10
+    assert last['total_confirmed'] == 7
+    assert last['total_dxcc'] == 2
+    assert last['total_challenge'] == 5
+    assert last['total_vucc'] == 3
+    assert last['total_ffma'] == 3
+    assert sum(data['20M'] for data in bin_data.data) == 5
+    assert sum(data['6M'] for data in bin_data.data) == 3
+    assert sum(data['challenge_20M'] for data in bin_data.data) == 2
+    assert sum(data['CW'] for data in bin_data.data) == 5
+    assert sum(data['DATA'] for data in bin_data.data) == 2
+
+
+def test_crunch_data_bins():
+    bin_data, _ = crunch(LOG)
+    new_dxcc_bins = [i for i, data in enumerate(bin_data.data) if data['new_dxcc']]
+    # Canada is first confirmed on 15M at midnight on the first day, the USA at 01:00.
+    assert new_dxcc_bins == [0, 2]
+    assert bin_data.data[0]['challenge_15M'] == 1
+    assert bin_data.data[2]['worked'] == 1
+    # each bin holds half an hour.
+    assert [data['total_worked'] for data in bin_data.data[:5]] == [1, 1, 2, 2, 3]
+
+
+def test_crunch_data_summary():
+    _, output = crunch(LOG)
+    assert '   10 counted worked\n' in output
+    assert '    8 unique calls\n' in output
+    assert '    5 challenge\n' in output
+    assert '    2 total dxcc\n' in output
+    assert '   20M      1      1      0      3      5\n' in output
+    assert ' TOTAL      5      2      0      3     10\n' in output
+    assert 'first QSO date: 2024-01-01\n' in output
+    assert 'last QSO date: 2024-01-04\n' in output
+    assert ('   1 Canada                                   2     1     0     1'
+            '    0    0    0    0    1    0    1    0    0    0\n') in output
+    assert (' 291 United States of America                 3     2     0     1'
+            '    0    0    1    0    1    0    0    0    0    1\n') in output
+
+
+def test_crunch_data_leaves_qsos():
+    qsos = copy.deepcopy(LOG)
+    crunch(qsos)
+    assert qsos == LOG